@@ -0,0 +1,140 @@
+"""
+Benchmark de la cobertura (hedging) de llamadas al LLM contra un modelo simulado con latencia inyectada.
+
+El modelo simulado responde tras una latencia lognormal y, con probabilidad --prob-cola, multiplica esa latencia
+por --factor-cola (la cola larga de OpenAI: colas internas, reintentos, instancias lentas). Se corre la misma
+secuencia de llamadas sin cobertura y con cobertura, y se compara:
+  - latencia p50 / p90 / p99 / máxima,
+  - fracción de llamadas cubiertas y cuántas ganó la cobertura,
+  - solicitudes extra y segundos de generación desperdiciados en las perdedoras (proxy del costo extra).
+
+Al final corre unas llamadas por `cobertura_llm.invocar` desde hilos (como los nodos del grafo) para verificar
+el camino real: bucle propio, contexto copiado y cancelación de la perdedora.
+
+Uso:
+    python benchmark_cobertura.py --llamadas 600 --concurrencia 20
+    python benchmark_cobertura.py --prob-cola 0.1 --factor-cola 8 --tasa-maxima 0.15
+"""
+import os
+import sys
+import math
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import cobertura_llm
+from cobertura_llm import Cobertura
+
+
+class ModeloSimulado:
+    """Runnable mínimo con `ainvoke`/`invoke`. Cuenta solicitudes, cancelaciones y segundos de generación tirados."""
+
+    def __init__(self, mediana: float, sigma: float, prob_cola: float, factor_cola: float, semilla: int = 7):
+        self.mu = math.log(mediana)
+        self.sigma = sigma
+        self.prob_cola = prob_cola
+        self.factor_cola = factor_cola
+        self.azar = random.Random(semilla)
+        self.solicitudes = 0
+        self.canceladas = 0
+        self.segundos_desperdiciados = 0.0
+
+    def latencia(self) -> float:
+        valor = self.azar.lognormvariate(self.mu, self.sigma)
+        if self.azar.random() < self.prob_cola:
+            valor *= self.factor_cola
+        return valor
+
+    async def ainvoke(self, mensajes, timeout: float | None = None, **kwargs):
+        self.solicitudes += 1
+        espera = self.latencia()
+        inicio = time.perf_counter()
+        try:
+            if timeout is not None and espera > timeout:
+                await asyncio.sleep(timeout)
+                raise TimeoutError(f"Request timed out ({timeout:.1f}s)")
+            await asyncio.sleep(espera)
+        except asyncio.CancelledError:
+            self.canceladas += 1
+            self.segundos_desperdiciados += time.perf_counter() - inicio
+            raise
+        return f"respuesta a {len(mensajes)} mensajes"
+
+    def invoke(self, mensajes, timeout: float | None = None, **kwargs):
+        time.sleep(self.latencia())
+        return f"respuesta a {len(mensajes)} mensajes"
+
+
+def _percentil(valores: list[float], p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+async def _correr(cobertura: Cobertura, modelo: ModeloSimulado, llamadas: int, concurrencia: int, timeout: float) -> dict:
+    semaforo = asyncio.Semaphore(concurrencia)
+    latencias = []
+
+    async def una():
+        async with semaforo:
+            inicio = time.perf_counter()
+            try:
+                await cobertura.correr(modelo, ["system", "human"], timeout)
+            except TimeoutError:
+                pass
+            latencias.append(time.perf_counter() - inicio)
+
+    await asyncio.gather(*(una() for _ in range(llamadas)))
+    return {
+        "p50": statistics.median(latencias), "p90": _percentil(latencias, 0.9), "p99": _percentil(latencias, 0.99),
+        "max": max(latencias), **cobertura.estado(),
+        "solicitudes": modelo.solicitudes, "canceladas": modelo.canceladas, "desperdicio": modelo.segundos_desperdiciados,
+    }
+
+
+def _verificar_invocar(modelo: ModeloSimulado, llamadas: int = 8):
+    """Camino real de los nodos del grafo: invocar() síncrono desde varios hilos."""
+    cobertura_llm.LLM_COBERTURA = True
+    cobertura_llm.cobertura = Cobertura(tasa_maxima=1.0)
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=llamadas) as hilos:
+        respuestas = list(hilos.map(lambda _: cobertura_llm.invocar(modelo, ["system", "human"], timeout=30), range(llamadas)))
+    assert all(r.startswith("respuesta") for r in respuestas)
+    print(f"\ninvocar() desde {llamadas} hilos: OK en {time.perf_counter() - inicio:.2f}s · {cobertura_llm.cobertura.estado()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llamadas", type=int, default=600)
+    parser.add_argument("--concurrencia", type=int, default=20)
+    parser.add_argument("--mediana", type=float, default=0.4, help="Latencia mediana simulada (s)")
+    parser.add_argument("--sigma", type=float, default=0.35)
+    parser.add_argument("--prob-cola", type=float, default=0.05)
+    parser.add_argument("--factor-cola", type=float, default=6.0)
+    parser.add_argument("--percentil", type=float, default=cobertura_llm.LLM_COBERTURA_PERCENTIL)
+    parser.add_argument("--tasa-maxima", type=float, default=cobertura_llm.LLM_COBERTURA_TASA_MAXIMA)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    # El umbral inicial de producción (8s) es para latencias reales; acá se escala a la mediana simulada
+    cobertura_llm.LLM_COBERTURA_UMBRAL_INICIAL = args.mediana * 3
+    cobertura_llm.LLM_COBERTURA_UMBRAL_MINIMO = args.mediana / 4
+
+    print(f"{args.llamadas} llamadas, concurrencia {args.concurrencia} · latencia mediana {args.mediana}s, sigma {args.sigma}, "
+          f"cola {args.prob_cola * 100:.0f}% x{args.factor_cola}\n")
+    print(f"{'variante':<16} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7} {'cubiertas':>10} {'ganó cob.':>10} {'extra':>7} {'desperdicio':>12}")
+    for nombre, tasa in (("sin cobertura", 0.0), (f"cobertura p{args.percentil * 100:.0f}", args.tasa_maxima)):
+        modelo = ModeloSimulado(args.mediana, args.sigma, args.prob_cola, args.factor_cola)
+        r = asyncio.run(_correr(Cobertura(percentil=args.percentil, tasa_maxima=tasa), modelo, args.llamadas, args.concurrencia, args.timeout))
+        extra = (r["solicitudes"] - args.llamadas) / args.llamadas
+        print(f"{nombre:<16} {r['p50']:>6.2f}s {r['p90']:>6.2f}s {r['p99']:>6.2f}s {r['max']:>6.2f}s "
+              f"{r['cubiertas'] / args.llamadas * 100:>9.1f}% {r['ganadas_por_cobertura']:>10} {extra * 100:>6.1f}% {r['desperdicio']:>11.1f}s")
+
+    _verificar_invocar(ModeloSimulado(args.mediana, args.sigma, args.prob_cola, args.factor_cola, semilla=11))
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
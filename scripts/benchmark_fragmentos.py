@@ -0,0 +1,125 @@
+"""
+Benchmark del reparto de conversaciones entre procesos worker (fragmentos.py) con un LLM simulado.
+
+Cada turno simulado tiene una parte de CPU (armar el prompt y (de)serializar el historial, como hace el
+checkpointer) y una espera de red (la llamada al LLM). La parte de CPU es la que limita a un solo proceso
+por el GIL; con N workers el throughput debería escalar casi linealmente hasta la cantidad de núcleos.
+
+Verifica además que:
+  - los turnos de una misma conversación se completan en el orden en que se enviaron,
+  - al agregar/quitar workers en caliente solo se mueve ~1/N de las conversaciones y el orden se mantiene.
+
+Uso:
+    python benchmark_fragmentos.py --workers 1 2 4 --turnos 400 --conversaciones 80
+    python benchmark_fragmentos.py --workers 2 --rebalanceo
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+
+from fragmentos import AnilloHash, Despachador
+
+HISTORIAL_EJEMPLO = [
+    {"role": "user" if i % 2 else "ai", "content": f"Mensaje {i}: " + "busco algo con pileta cerca del río " * 8}
+    for i in range(60)
+]
+
+
+async def turno_simulado(tarea: dict):
+    """Manejador que corre en cada worker: CPU (prompt + serde del historial) y luego la espera del LLM."""
+    fin_cpu = time.perf_counter() + tarea["cpu_ms"] / 1000
+    while time.perf_counter() < fin_cpu:
+        json.loads(json.dumps(HISTORIAL_EJEMPLO))
+    await asyncio.sleep(random.lognormvariate(tarea["llm_mu"], 0.5))
+
+
+def _tareas(turnos: int, conversaciones: int, cpu_ms: float, llm_ms: float) -> list[tuple[str, dict]]:
+    mu = math.log(llm_ms / 1000)
+    return [
+        (f"conv-{i % conversaciones}", {"id": i, "tipo": "turno", "cpu_ms": cpu_ms, "llm_mu": mu})
+        for i in range(turnos)
+    ]
+
+
+async def _correr(workers: int, tareas: list[tuple[str, dict]], rebalanceo: bool = False) -> dict:
+    despachador = Despachador(workers, manejador="benchmark_fragmentos:turno_simulado")
+    completadas: dict[str, list[int]] = {}
+    terminado = asyncio.Event()
+
+    def al_completar(clave, id_tarea):
+        completadas.setdefault(clave, []).append(id_tarea)
+        if sum(len(v) for v in completadas.values()) == len(tareas):
+            terminado.set()
+
+    despachador.al_completar = al_completar
+    await despachador.iniciar()
+    while not despachador.listo():
+        await asyncio.sleep(0.05)
+
+    inicio = time.perf_counter()
+    mitad = len(tareas) // 2
+    for i, (clave, tarea) in enumerate(tareas):
+        if rebalanceo and i == mitad // 2:
+            await despachador.escalar(workers + 1)
+        if rebalanceo and i == mitad:
+            # Quitar un worker drena sus conversaciones en curso: no bloqueamos el envío mientras tanto
+            asyncio.create_task(despachador.escalar(workers))
+        despachador.enviar(clave, tarea)
+        await asyncio.sleep(0)
+    await terminado.wait()
+    segundos = time.perf_counter() - inicio
+    await despachador.cerrar()
+
+    esperado: dict[str, list[int]] = {}
+    for clave, tarea in tareas:
+        esperado.setdefault(clave, []).append(tarea["id"])
+    desordenadas = [c for c in esperado if completadas.get(c) != esperado[c]]
+    return {"workers": workers, "segundos": round(segundos, 2), "turnos_por_segundo": round(len(tareas) / segundos, 1),
+            "conversaciones_desordenadas": len(desordenadas)}
+
+
+def movimiento_claves(workers: int, claves: int = 10000) -> float:
+    """Fracción de conversaciones que cambian de worker al pasar de N a N+1 workers."""
+    anillo = AnilloHash()
+    for i in range(workers):
+        anillo.agregar(f"w{i}")
+    antes = {c: anillo.nodo_para(f"conv-{c}") for c in range(claves)}
+    anillo.agregar(f"w{workers}")
+    return sum(antes[c] != anillo.nodo_para(f"conv-{c}") for c in range(claves)) / claves
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--turnos", type=int, default=400)
+    parser.add_argument("--conversaciones", type=int, default=80)
+    parser.add_argument("--cpu-ms", type=float, default=20.0, help="CPU por turno (prompt + serde del checkpoint)")
+    parser.add_argument("--llm-ms", type=float, default=300.0, help="Latencia mediana del LLM simulado")
+    parser.add_argument("--rebalanceo", action="store_true", help="Agregar y quitar un worker en medio de la corrida")
+    args = parser.parse_args()
+
+    print(f"Núcleos disponibles: {os.cpu_count()} · {args.turnos} turnos en {args.conversaciones} conversaciones · "
+          f"CPU {args.cpu_ms} ms + LLM ~{args.llm_ms} ms por turno\n")
+    base = None
+    for n in args.workers:
+        r = asyncio.run(_correr(n, _tareas(args.turnos, args.conversaciones, args.cpu_ms, args.llm_ms), args.rebalanceo))
+        if n == 1:
+            base = r["turnos_por_segundo"]
+        escala = f", x{r['turnos_por_segundo'] / base:.2f} vs 1 worker" if base else ""
+        orden = "OK" if r["conversaciones_desordenadas"] == 0 else f"MAL ({r['conversaciones_desordenadas']} desordenadas)"
+        print(f"{n:>3} workers{' (+1/-1 en caliente)' if args.rebalanceo else ''}: {r['turnos_por_segundo']:>7.1f} turnos/s "
+              f"({r['segundos']}s{escala})  orden por conversación: {orden}")
+
+    print("\nConversaciones que cambian de worker al agregar uno (ideal 1/(N+1)):")
+    for n in (1, 2, 4, 8):
+        print(f"  {n} -> {n + 1}: {movimiento_claves(n) * 100:5.1f}%  (ideal {100 / (n + 1):.1f}%)")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
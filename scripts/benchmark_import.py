@@ -0,0 +1,81 @@
+"""
+Benchmark de tiempo de importación de los módulos del bot.
+
+Cada módulo se importa en un intérprete limpio con `python -X importtime` y se reporta:
+  - el tiempo acumulado del propio módulo (lo que paga uvicorn al arrancar),
+  - los paquetes de terceros más pesados que arrastra.
+
+Con --guardar los resultados se agregan a un JSONL para seguir la evolución entre commits.
+
+Uso:
+    python benchmark_import.py
+    python benchmark_import.py --modulos bot_whatsapp main tools --top 8 --guardar ../.tmp/import_times.jsonl
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULOS_POR_DEFECTO = ["bot_whatsapp", "main", "tools", "state", "prompts", "tenants", "http_compartido", "salud"]
+
+
+def medir_modulo(modulo: str) -> dict:
+    """Importa `modulo` en un proceso nuevo y parsea la salida de -X importtime (microsegundos)."""
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=SCRIPTS_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return {"modulo": modulo, "error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "falló"}
+
+    total_us = 0
+    por_paquete: dict[str, int] = {}
+    for linea in proc.stderr.splitlines():
+        if not linea.startswith("import time:") or "|" not in linea:
+            continue
+        try:
+            propio, acumulado, nombre = [p.strip() for p in linea.replace("import time:", "").split("|")]
+            propio_us, acumulado_us = int(propio), int(acumulado)
+        except ValueError:
+            continue  # Encabezado de la tabla
+        if nombre == modulo:
+            total_us = acumulado_us
+        # Agrupamos el tiempo propio de cada submódulo en su paquete de primer nivel
+        raiz = nombre.split(".")[0]
+        por_paquete[raiz] = por_paquete.get(raiz, 0) + propio_us
+
+    return {"modulo": modulo, "total_ms": round(total_us / 1000, 1), "por_paquete_ms": {
+        k: round(v / 1000, 1) for k, v in sorted(por_paquete.items(), key=lambda kv: -kv[1])
+    }}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modulos", nargs="+", default=MODULOS_POR_DEFECTO)
+    parser.add_argument("--top", type=int, default=5, help="Paquetes más pesados a mostrar por módulo")
+    parser.add_argument("--guardar", help="Ruta JSONL donde agregar los resultados")
+    args = parser.parse_args()
+
+    resultados = []
+    for modulo in args.modulos:
+        r = medir_modulo(modulo)
+        resultados.append(r)
+        if "error" in r:
+            print(f"{modulo:<18} ERROR: {r['error']}")
+            continue
+        pesados = ", ".join(f"{k} {v}ms" for k, v in list(r["por_paquete_ms"].items())[:args.top])
+        print(f"{modulo:<18} {r['total_ms']:>9.1f} ms   [{pesados}]")
+
+    if args.guardar:
+        os.makedirs(os.path.dirname(os.path.abspath(args.guardar)), exist_ok=True)
+        with open(args.guardar, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"ts": time.time(), "python": sys.version.split()[0], "resultados": resultados}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark de memoria: N clientes en un solo proceso multi-tenant vs N contenedores (un proceso por cliente).
+
+Cada "contenedor" se simula con un proceso Python independiente que importa bot_whatsapp tal como lo hace uvicorn
+y corre el warmup del lifespan (`precalentar`): grafo compilado, cliente de OpenAI con las tools, checkpointer y SDKs
+de Google. Importar bot_whatsapp solo ya no alcanza: desde el arranque perezoso, nada de eso se carga al importar.
+Se mide el RSS de cada proceso con todo cargado. El hijo verifica que LangGraph, LangChain y Google estén en memoria.
+
+Sin Postgres alcanzable el checkpointer cae al respaldo local (un solo intento: PG_CONNECT_INTENTOS=1 por defecto
+acá), así que el RSS no incluye las conexiones abiertas del pool. Para medirlas, correrlo con DB_URI apuntando a un
+Postgres real.
+
+Uso:
+    python benchmark_multitenant.py --tenants 1 5 10
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Código que corre dentro de cada proceso hijo
+CODIGO_HIJO = r"""
+import sys
+import json
+import asyncio
+import bot_whatsapp
+from tenants import obtener_tenants, tenant_actual, prompt_tenant, config_tenant
+from prompts import SYSTEM_PROMPT
+
+# Lo mismo que hace el lifespan de uvicorn antes de atender el primer turno
+asyncio.run(bot_whatsapp.precalentar())
+import main
+import tools
+main.get_graph()
+main.get_llm_with_tools()
+tools.precargar_google()
+faltantes = [m for m in ("langgraph", "langchain_core", "langchain_openai", "googleapiclient") if m not in sys.modules]
+if faltantes:
+    raise SystemExit(f"El warmup no cargó {faltantes}: la medición no sería la de un proceso real")
+
+# Tocar la configuración de cada tenant como lo haría el primer turno de cada cliente
+for tenant in obtener_tenants().values():
+    tenant_actual.set(tenant)
+    prompt_tenant(SYSTEM_PROMPT)
+    config_tenant("SPREADSHEET_ID")
+
+rss_kb = 0
+with open("/proc/self/status") as f:
+    for linea in f:
+        if linea.startswith("VmRSS:"):
+            rss_kb = int(linea.split()[1])
+print("RESULTADO " + json.dumps({"rss_kb": rss_kb}))
+"""
+
+# Conexiones que abren como máximo los pools de cada proceso: checkpoints (10) + almacén de mensajes (4), ver main.py
+POOL_MAX_SIZE = 14
+
+
+def _env_hijo(tenants_file: str) -> dict:
+    env = dict(os.environ)
+    env["TENANTS_FILE"] = tenants_file
+    # ChatOpenAI exige una key para instanciarse; el benchmark nunca llama a OpenAI
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    # Sin Postgres, no esperar los reintentos de conexión en cada hijo
+    env.setdefault("PG_CONNECT_INTENTOS", "1")
+    return env
+
+
+def _lanzar(tenants_file: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-c", CODIGO_HIJO],
+        cwd=SCRIPTS_DIR, env=_env_hijo(tenants_file),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+
+
+def _rss_de(proc: subprocess.Popen) -> int:
+    salida, errores = proc.communicate()
+    for linea in salida.splitlines():
+        if linea.startswith("RESULTADO "):
+            return json.loads(linea[len("RESULTADO "):])["rss_kb"]
+    raise RuntimeError(f"El proceso hijo no reportó memoria (exit={proc.returncode}): {errores.strip()[-500:]}")
+
+
+def _escribir_tenants(n: int, directorio: str) -> str:
+    ruta = os.path.join(directorio, f"tenants_{n}.json")
+    tenants = [
+        {
+            "id": f"cliente_{i}",
+            "chatwoot_account_id": str(i + 1),
+            "system_prompt": f"Eres el asistente comercial del cliente {i}.",
+            "config": {"SPREADSHEET_ID": f"sheet-{i}", "CALCOM_EVENT_TYPE_ID": str(i + 1)},
+        }
+        for i in range(n)
+    ]
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump({"tenants": tenants}, f)
+    return ruta
+
+
+def medir(n: int, directorio: str) -> dict:
+    # Modo multi-tenant: un solo proceso con N clientes
+    multi_kb = _rss_de(_lanzar(_escribir_tenants(n, directorio)))
+
+    # Modo contenedores: N procesos single-tenant (TENANTS_FILE inexistente), lanzados en paralelo
+    sin_tenants = os.path.join(directorio, "no_existe.json")
+    procesos = [_lanzar(sin_tenants) for _ in range(n)]
+    contenedores_kb = sum(_rss_de(p) for p in procesos)
+
+    return {
+        "tenants": n,
+        "multi_tenant_mb": round(multi_kb / 1024, 1),
+        "contenedores_mb": round(contenedores_kb / 1024, 1),
+        "ahorro_mb": round((contenedores_kb - multi_kb) / 1024, 1),
+        "conexiones_pg_max_multi": POOL_MAX_SIZE,
+        "conexiones_pg_max_contenedores": POOL_MAX_SIZE * n,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, nargs="+", default=[1, 5, 10])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        print(f"{'N':>4} | {'1 proceso (MB)':>15} | {'N procesos (MB)':>16} | {'Ahorro (MB)':>12} | {'Conex. PG máx':>14}")
+        for n in args.tenants:
+            r = medir(n, directorio)
+            print(
+                f"{r['tenants']:>4} | {r['multi_tenant_mb']:>15} | {r['contenedores_mb']:>16} | "
+                f"{r['ahorro_mb']:>12} | {r['conexiones_pg_max_multi']:>5} vs {r['conexiones_pg_max_contenedores']:<5}"
+            )
+
+
+if __name__ == "__main__":
+    main()
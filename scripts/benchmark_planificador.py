@@ -0,0 +1,190 @@
+"""
+Benchmark del planificador global del LLM (planificador_llm.py) contra una cuenta de OpenAI simulada.
+
+La cuenta simulada aplica un límite de tokens y de solicitudes por ventana (escalada a --ventana segundos para que
+la corrida dure poco), devuelve los headers x-ratelimit-* como OpenAI y responde 429 al pasarse. Muchas
+conversaciones en paralelo (una fracción en Lista_Cierre, el resto Nueva) llaman al modelo en ráfaga.
+
+Cada turno corre como en bot_whatsapp: una tarea del event loop que pide un hilo. Se compara:
+  - sin planificador: turnos en asyncio.to_thread (pool por defecto, min(32, cpu+4) hilos); todas las llamadas
+    salen a la vez y reintentan tras el 429 (como la SDK con max_retries),
+  - planificador en to_thread: el planificador con los turnos en el pool por defecto (los turnos en cola del LLM
+    ocupan los hilos y un Lista_Cierre espera en la FIFO del executor),
+  - con planificador: turnos en planificador_llm.correr_turno (pool de PLANIFICADOR_HILOS_TURNOS, o --hilos) +
+    cola por prioridad + presupuesto por headers + concurrencia adaptativa.
+Reporta 429 recibidos, turnos perdidos (la SDK se rinde tras sus reintentos) y latencia p50/p95 por fase
+de los turnos que respondieron (incluye la espera en cola y los reintentos).
+
+Uso:
+    python benchmark_planificador.py --conversaciones 40 --tpm 40000 --ventana 6
+    python benchmark_planificador.py --hilos 5      # pool chico (1 vCPU): la prioridad se sostiene igual
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import threading
+import statistics
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import planificador_llm
+
+
+class RateLimitError(Exception):
+    """Mismo nombre que openai.RateLimitError: el planificador lo reconoce por nombre."""
+
+    def __init__(self, headers: dict):
+        super().__init__("Rate limit reached")
+        self.status_code = 429
+        self.response = type("Respuesta", (), {"headers": headers})()
+
+
+class Respuesta:
+    def __init__(self, tokens: int, headers: dict):
+        self.usage_metadata = {"total_tokens": tokens}
+        self.response_metadata = {"headers": headers}
+
+
+class CuentaSimulada:
+    """Límite de tokens/solicitudes por ventana deslizante, con la latencia del modelo y los headers de OpenAI."""
+
+    def __init__(self, tpm: int, rpm: int, ventana: float, latencia: float):
+        self.tpm, self.rpm, self.ventana, self.latencia = tpm, rpm, ventana, latencia
+        self._uso: deque[tuple[float, int]] = deque()
+        self._lock = threading.Lock()
+        self.errores_429 = 0
+        self.azar = random.Random(3)
+
+    def _headers(self, ahora: float) -> dict:
+        usados = sum(t for _, t in self._uso)
+        reinicio = max(0.0, self._uso[0][0] + self.ventana - ahora) if self._uso else 0.0
+        return {
+            "x-ratelimit-limit-tokens": str(self.tpm), "x-ratelimit-limit-requests": str(self.rpm),
+            "x-ratelimit-remaining-tokens": str(max(0, self.tpm - usados)),
+            "x-ratelimit-remaining-requests": str(max(0, self.rpm - len(self._uso))),
+            "x-ratelimit-reset-tokens": f"{reinicio:.3f}s", "x-ratelimit-reset-requests": f"{reinicio:.3f}s",
+        }
+
+    def invoke(self, tokens: int):
+        with self._lock:
+            ahora = time.time()
+            while self._uso and ahora - self._uso[0][0] > self.ventana:
+                self._uso.popleft()
+            if sum(t for _, t in self._uso) + tokens > self.tpm or len(self._uso) + 1 > self.rpm:
+                self.errores_429 += 1
+                headers = self._headers(ahora)
+                headers["retry-after"] = headers["x-ratelimit-reset-tokens"].rstrip("s")
+                raise RateLimitError(headers)
+            self._uso.append((ahora, tokens))
+        time.sleep(self.azar.lognormvariate(0, 0.3) * self.latencia)
+        with self._lock:
+            return Respuesta(tokens, self._headers(time.time()))
+
+
+def _llamada_sin_planificador(cuenta: CuentaSimulada, tokens: int):
+    # Como la SDK de OpenAI: reintenta el 429 con backoff exponencial corto, sin coordinación entre llamadas
+    for intento in range(6):
+        try:
+            return cuenta.invoke(tokens)
+        except RateLimitError:
+            time.sleep(0.25 * 2 ** intento * random.uniform(0.5, 1.5))
+    return None
+
+
+def _llamada_con_planificador(cuenta: CuentaSimulada, tokens: int, prioridad: float):
+    while True:
+        try:
+            with planificador_llm.permiso(prioridad, tokens, espera_maxima=120) as permiso:
+                respuesta = cuenta.invoke(tokens)
+                permiso.registrar(respuesta)
+                return respuesta
+        except RateLimitError:
+            continue
+
+
+def _turno_con_planificador(cuenta: CuentaSimulada, tokens: int, fase: str, thread_id: str):
+    # Como razonar_estado: la prioridad sale del estado (y queda recordada para ordenar el próximo turno)
+    _llamada_con_planificador(cuenta, tokens, planificador_llm.prioridad_para({"fase_venta": fase}, thread_id))
+
+
+def _correr(variante: str, args) -> dict:
+    con_planificador = variante != "sin planificador"
+    cuenta = CuentaSimulada(args.tpm, args.rpm, args.ventana, args.latencia)
+    planificador_llm.VENTANA_SEGUNDOS = args.ventana
+    planificador_llm.planificador = planificador_llm.Planificador(tpm=args.tpm * 4, rpm=args.rpm * 4)  # arranca sin saber el límite real
+    planificador_llm._hilos_turnos = ThreadPoolExecutor(max_workers=args.hilos, thread_name_prefix="turno")
+    planificador_llm._asientos = planificador_llm._Asientos(args.hilos)
+    azar = random.Random(1)
+    fases = ["Lista_Cierre" if azar.random() < args.fraccion_cierre else "Nueva" for _ in range(args.conversaciones)]
+    # Un lead en Lista_Cierre ya tuvo turnos antes en este proceso: su fase es conocida antes de leer el estado
+    for i, fase in enumerate(fases):
+        planificador_llm.prioridad_para({"fase_venta": fase}, f"conv-{i}")
+    latencias: dict[str, list[float]] = {"Lista_Cierre": [], "Nueva": []}
+    fallidas = []
+
+    async def conversacion(i: int):
+        fase = fases[i]
+        for _ in range(args.turnos):
+            tokens = int(azar.uniform(0.6, 1.4) * args.tokens)
+            inicio = time.time()
+            if variante == "planificador en to_thread":
+                await asyncio.to_thread(_turno_con_planificador, cuenta, tokens, fase, f"conv-{i}")
+            elif con_planificador:
+                await planificador_llm.correr_turno(f"conv-{i}", _turno_con_planificador, cuenta, tokens, fase, f"conv-{i}")
+            elif await asyncio.to_thread(_llamada_sin_planificador, cuenta, tokens) is None:
+                # La SDK se rindió: el turno del lead termina en error
+                fallidas.append(fase)
+                continue
+            latencias[fase].append(time.time() - inicio)
+
+    async def todas():
+        await asyncio.gather(*(conversacion(i) for i in range(args.conversaciones)))
+
+    inicio = time.time()
+    asyncio.run(todas())
+    planificador_llm._hilos_turnos.shutdown()
+    return {"segundos": time.time() - inicio, "errores_429": cuenta.errores_429, "latencias": latencias, "fallidas": len(fallidas),
+            "estado": planificador_llm.planificador.estado() if con_planificador else None}
+
+
+def _p(valores: list[float], q: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * q))] if ordenados else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversaciones", type=int, default=40)
+    parser.add_argument("--turnos", type=int, default=2)
+    parser.add_argument("--fraccion-cierre", type=float, default=0.2)
+    parser.add_argument("--tokens", type=int, default=2000, help="Tokens medios por llamada")
+    parser.add_argument("--tpm", type=int, default=40000, help="Tokens por ventana de la cuenta simulada")
+    parser.add_argument("--rpm", type=int, default=200)
+    parser.add_argument("--ventana", type=float, default=6.0, help="Ventana de la cuenta (60s reales, escalada)")
+    parser.add_argument("--latencia", type=float, default=0.5)
+    parser.add_argument("--hilos", type=int, default=planificador_llm.PLANIFICADOR_HILOS_TURNOS,
+                        help="Hilos de turno con planificador (sin planificador se usa el pool por defecto de asyncio)")
+    args = parser.parse_args()
+
+    demanda = args.conversaciones * args.turnos * args.tokens
+    print(f"{args.conversaciones} conversaciones x {args.turnos} turnos · ~{args.tokens} tokens/llamada · "
+          f"cuenta de {args.tpm} tokens cada {args.ventana}s (demanda total {demanda / args.tpm:.1f} ventanas) · "
+          f"{args.hilos} hilos de turno (pool por defecto: {min(32, (os.cpu_count() or 1) + 4)})\n")
+    print(f"{'variante':<26} {'429':>5} {'fallidas':>9} {'total':>8} {'Lista_Cierre p50/p95':>22} {'Nueva p50/p95':>18}")
+    for nombre in ("sin planificador", "planificador en to_thread", "con planificador"):
+        r = _correr(nombre, args)
+        cierre, nueva = r["latencias"]["Lista_Cierre"], r["latencias"]["Nueva"]
+        print(f"{nombre:<26} {r['errores_429']:>5} {r['fallidas']:>9} {r['segundos']:>7.1f}s "
+              f"{statistics.median(cierre):>10.2f}s / {_p(cierre, 0.95):>6.2f}s {statistics.median(nueva):>8.2f}s / {_p(nueva, 0.95):>6.2f}s")
+        if r["estado"]:
+            e = r["estado"]
+            print(f"{'':<26} concurrencia final {e['concurrencia']}, encoladas {e['encoladas']}, "
+                  f"espera máx {e['espera_maxima']:.2f}s, límite leído {e['limite_tokens']} tokens")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -0,0 +1,266 @@
+import re
+import sys
+import math
+import time
+import zlib
+import hashlib
+import threading
+import unicodedata
+from typing import NamedTuple
+
+import numpy as np
+
+# Dimensión del espacio de features hasheadas. La matriz densa pesa 8192 float32 = 32 KB por propiedad (un catálogo
+# de 1000 filas entra en ~32 MB); las frecuencias se guardan dispersas (unos cientos de features por fila).
+# Las colisiones del hashing son despreciables para textos de este tamaño.
+DIMENSIONES = 2 ** 13
+
+# Peso de cada columna del catálogo en el vector de la propiedad
+PESOS_CAMPOS = {"nombre": 1.5, "zona": 2.0, "descripcion": 1.0, "rentabilidad": 1.0}
+
+# Sinónimos regionales: el lead escribe en argentino, el catálogo está en México.
+SINONIMOS = {
+    "pileta": ["piscina", "alberca"],
+    "piscina": ["pileta", "alberca"],
+    "alberca": ["pileta", "piscina"],
+    "rio": ["ribera", "rivera"],
+    "playa": ["mar", "costa", "frente"],
+    "mar": ["playa", "costa"],
+    "invertir": ["inversion", "rentabilidad", "renta", "roi"],
+    "inversion": ["invertir", "rentabilidad", "renta", "roi"],
+    "renta": ["rentabilidad", "alquiler", "airbnb"],
+    "depto": ["departamento"],
+    "departamento": ["depto", "condo"],
+    "casa": ["residencia", "villa"],
+}
+
+# Palabras vacías que solo meten ruido en la similitud
+STOPWORDS = {
+    "a", "al", "algo", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los", "me", "mi", "para",
+    "por", "que", "quiero", "busco", "un", "una", "unos", "unas", "y", "o", "cerca", "tipo", "tenga", "sea",
+}
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin tildes y solo alfanuméricos."""
+    texto = unicodedata.normalize("NFKD", str(texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r"[^a-z0-9]+", " ", texto).strip()
+
+
+def _features(texto: str, expandir_sinonimos: bool = False) -> list[str]:
+    """Palabras, bigramas de palabras y n-gramas de caracteres (3 y 4) de cada palabra."""
+    palabras = [p for p in normalizar(texto).split() if p not in STOPWORDS]
+    if expandir_sinonimos:
+        palabras = palabras + [s for p in palabras for s in SINONIMOS.get(p, [])]
+
+    features = [f"w:{p}" for p in palabras]
+    features += [f"b:{a}_{b}" for a, b in zip(palabras, palabras[1:])]
+    for p in palabras:
+        marcada = f"<{p}>"
+        for n in (3, 4):
+            features += [f"c:{marcada[i:i + n]}" for i in range(len(marcada) - n + 1)]
+    return features
+
+
+def _vector_tf(campos: dict[str, str], expandir_sinonimos: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    """Vector de frecuencias (sublineal) en el espacio hasheado, disperso: (índices, valores)."""
+    conteos: dict[int, float] = {}
+    for campo, texto in campos.items():
+        peso = PESOS_CAMPOS.get(campo, 1.0)
+        for feature in _features(texto, expandir_sinonimos):
+            indice = zlib.crc32(feature.encode("utf-8")) % DIMENSIONES
+            conteos[indice] = conteos.get(indice, 0.0) + peso
+    indices = np.fromiter(conteos.keys(), dtype=np.int64, count=len(conteos))
+    valores = np.fromiter(conteos.values(), dtype=np.float32, count=len(conteos))
+    return indices, (1.0 + np.log(valores)).astype(np.float32)
+
+
+def _huella(propiedad: dict) -> str:
+    contenido = "|".join(str(propiedad.get(k, "")) for k in ("nombre", "zona", "descripcion", "rentabilidad", "precio"))
+    return hashlib.sha1(contenido.encode("utf-8")).hexdigest()
+
+
+class _Instantanea(NamedTuple):
+    """Todo lo que usa una búsqueda, consistente entre sí. Nunca se modifica: se reemplaza entera."""
+    propiedades: list[dict]
+    huellas: list[str]
+    tf: list[tuple[np.ndarray, np.ndarray]]   # frecuencias dispersas por fila, para reusar en la próxima actualización
+    idf: np.ndarray
+    matriz: np.ndarray                        # TF-IDF normalizado, denso (el producto matriz-vector de la búsqueda)
+    precios: np.ndarray
+
+
+_VACIA = _Instantanea([], [], [], np.ones(DIMENSIONES, dtype=np.float32), np.zeros((0, DIMENSIONES), dtype=np.float32),
+                      np.zeros(0, dtype=np.float64))
+
+
+class IndiceCatalogo:
+    """
+    Índice de similitud TF-IDF sobre features hasheadas, 100% local (NumPy).
+    Se actualiza incrementalmente: solo se re-vectorizan las filas cuyo contenido cambió en la planilla.
+    Las búsquedas (en los hilos de los turnos) leen una instantánea inmutable; `actualizar` arma la nueva aparte
+    y la publica con una sola asignación, así nunca ven filas de una versión con propiedades de otra.
+    """
+
+    def __init__(self):
+        self._datos = _VACIA
+        self._lock_actualizar = threading.Lock()
+        self.actualizado = 0.0
+
+    @property
+    def propiedades(self) -> list[dict]:
+        return self._datos.propiedades
+
+    def actualizar(self, propiedades: list[dict]) -> int:
+        """
+        Sincroniza el índice con la lista actual de propiedades. Devuelve cuántas filas se re-vectorizaron.
+        Cada propiedad es un dict con id, nombre, zona, precio (int), descripcion y rentabilidad.
+        """
+        # Dos refrescos del mismo catálogo a la vez (turnos en paralelo): el segundo reusa lo del primero
+        with self._lock_actualizar:
+            actual = self._datos
+            huellas = [_huella(p) for p in propiedades]
+            if huellas == actual.huellas:
+                # Nada que re-vectorizar, pero las otras columnas (imagenes, precio_str, id...) pueden haber
+                # cambiado: se publican las filas nuevas sobre los mismos vectores
+                self._datos = actual._replace(propiedades=list(propiedades))
+                self.actualizado = time.time()
+                return 0
+            anteriores = {h: i for i, h in enumerate(actual.huellas)}
+
+            filas = []
+            recalculadas = 0
+            for propiedad, huella in zip(propiedades, huellas):
+                i = anteriores.get(huella)
+                if i is not None:
+                    filas.append(actual.tf[i])
+                else:
+                    filas.append(_vector_tf({campo: propiedad.get(campo, "") for campo in PESOS_CAMPOS}))
+                    recalculadas += 1
+
+            # IDF suavizado sobre el catálogo completo (barato: un conteo por feature)
+            n = len(propiedades)
+            df = np.zeros(DIMENSIONES, dtype=np.int64)
+            for indices, _ in filas:
+                df[indices] += 1
+            idf = (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+
+            matriz = np.zeros((n, DIMENSIONES), dtype=np.float32)
+            for fila, (indices, valores) in enumerate(filas):
+                pesos = valores * idf[indices]
+                norma = float(np.linalg.norm(pesos))
+                matriz[fila, indices] = pesos / (norma or 1.0)
+
+            precios = np.array([p.get("precio") or 0 for p in propiedades], dtype=np.float64)
+            self._datos = _Instantanea(list(propiedades), huellas, filas, idf, matriz, precios)
+            self.actualizado = time.time()
+            return recalculadas
+
+    def buscar(self, consulta: str, top_k: int = 5, presupuesto_maximo: int | None = None,
+               presupuesto_minimo: int | None = None, zona: str | None = None) -> list[tuple[float, dict]]:
+        """Top-K propiedades más parecidas a la consulta en texto libre, respetando filtros de precio y zona."""
+        datos = self._datos   # una sola lectura: todo lo que sigue es de la misma versión del catálogo
+        if not datos.propiedades:
+            return []
+
+        indices, valores = _vector_tf({"descripcion": consulta}, expandir_sinonimos=True)
+        # Features repetidas por el hashing se suman, como en el vector denso
+        q = np.zeros(DIMENSIONES, dtype=np.float32)
+        np.add.at(q, indices, valores * datos.idf[indices])
+        norma = float(np.linalg.norm(q))
+        if norma == 0:
+            return []
+        puntajes = datos.matriz @ (q / norma)
+
+        # Filtros vectorizados: las propiedades sin precio cargado (0) no se descartan por precio
+        mascara = np.ones(len(datos.propiedades), dtype=bool)
+        con_precio = datos.precios > 0
+        if presupuesto_maximo:
+            mascara &= ~con_precio | (datos.precios <= presupuesto_maximo)
+        if presupuesto_minimo:
+            mascara &= ~con_precio | (datos.precios >= presupuesto_minimo)
+        if zona:
+            zona_norm = normalizar(zona)
+            mascara &= np.array([zona_norm in normalizar(p.get("zona", "")) for p in datos.propiedades], dtype=bool)
+
+        puntajes = np.where(mascara & (puntajes > 0), puntajes, -1.0)
+        k = min(top_k, int((puntajes > 0).sum()))
+        if k == 0:
+            return []
+        mejores = np.argpartition(-puntajes, k - 1)[:k]
+        mejores = mejores[np.argsort(-puntajes[mejores])]
+        return [(round(float(puntajes[i]), 4), datos.propiedades[i]) for i in mejores]
+
+
+# Un índice por planilla (en modo multi-tenant cada cliente tiene su catálogo)
+_indices: dict[str, IndiceCatalogo] = {}
+
+
+def indice_para(spreadsheet_id: str) -> IndiceCatalogo:
+    indice = _indices.get(spreadsheet_id)
+    if indice is None:
+        indice = _indices.setdefault(spreadsheet_id, IndiceCatalogo())
+    return indice
+
+
+# Catálogo de ejemplo para verificar la calidad del ranking: python catalogo.py (sale con código 1 si algo falla)
+CATALOGO_EJEMPLO = [
+    {"id": "1", "nombre": "Villa Selva Río", "zona": "Tulum", "precio": 450000,
+     "descripcion": "Villa de 3 recámaras con alberca privada a pasos del río y cenote", "rentabilidad": "ROI 9% anual en renta vacacional"},
+    {"id": "2", "nombre": "Penthouse Quinta", "zona": "Playa del Carmen", "precio": 380000,
+     "descripcion": "Penthouse frente al mar con rooftop y jacuzzi", "rentabilidad": "ROI 7% anual"},
+    {"id": "3", "nombre": "Casa Lagos", "zona": "Bacalar", "precio": 290000,
+     "descripcion": "Casa familiar junto a la laguna de los siete colores, jardín amplio", "rentabilidad": "Uso personal"},
+    {"id": "4", "nombre": "Loft Centro", "zona": "Mérida", "precio": 150000,
+     "descripcion": "Loft moderno en el centro histórico, ideal para nómadas digitales", "rentabilidad": "ROI 6% renta mensual"},
+    {"id": "5", "nombre": "Residencia Ribera", "zona": "Valladolid", "precio": 520000,
+     "descripcion": "Residencia colonial con piscina y terraza sobre la ribera del río", "rentabilidad": "Alta plusvalía, ROI 8% Airbnb"},
+    {"id": "6", "nombre": "Depto Polanco", "zona": "CDMX Polanco", "precio": 610000,
+     "descripcion": "Departamento de lujo con gimnasio y seguridad 24 horas", "rentabilidad": "ROI 5% anual"},
+]
+
+
+if __name__ == "__main__":
+    indice = IndiceCatalogo()
+    indice.actualizar(CATALOGO_EJEMPLO)
+
+    casos = [
+        ("algo con pileta cerca del río para invertir", None, {"1", "5"}),
+        ("frente al mar con jacuzzi", None, {"2"}),
+        ("casa junto a la laguna", None, {"3"}),
+        ("algo con pileta cerca del río para invertir", 480000, {"1"}),
+    ]
+    fallas = 0
+    for consulta, tope, esperados in casos:
+        inicio = time.perf_counter()
+        resultados = indice.buscar(consulta, top_k=len(esperados), presupuesto_maximo=tope)
+        ms = (time.perf_counter() - inicio) * 1000
+        ids = {p["id"] for _, p in resultados}
+        fallas += ids != esperados
+        estado = "OK " if ids == esperados else "MAL"
+        print(f"[{estado}] {consulta!r} (tope={tope}) -> {[(p['id'], s) for s, p in resultados]} en {ms:.2f} ms")
+
+    # Actualización incremental: solo se re-vectoriza la fila modificada, y el ranking la refleja
+    modificado = [dict(p) for p in CATALOGO_EJEMPLO]
+    modificado[3]["descripcion"] += " con alberca en la azotea"
+    recalculadas = indice.actualizar(modificado)
+    fallas += recalculadas != 1
+    print(f"[{'OK ' if recalculadas == 1 else 'MAL'}] Filas re-vectorizadas tras editar una propiedad: {recalculadas}")
+    azotea = indice.buscar("alberca en la azotea", top_k=1)
+    fallas += not azotea or azotea[0][1]["id"] != "4"
+    print(f"[{'OK ' if azotea and azotea[0][1]['id'] == '4' else 'MAL'}] 'alberca en la azotea' -> {[(p['id'], s) for s, p in azotea]}")
+
+    # Editar columnas que no se indexan no re-vectoriza nada, pero la búsqueda devuelve la fila nueva
+    fotos = [dict(p) for p in modificado]
+    fotos[3]["imagenes"] = "https://ejemplo.com/nueva.jpg"
+    recalculadas = indice.actualizar(fotos)
+    nueva = indice.buscar("alberca en la azotea", top_k=1)
+    correcto = recalculadas == 0 and bool(nueva) and nueva[0][1].get("imagenes") == fotos[3]["imagenes"]
+    fallas += not correcto
+    print(f"[{'OK ' if correcto else 'MAL'}] Cambio de imágenes sin re-vectorizar ({recalculadas} filas) visible en la búsqueda")
+
+    if fallas:
+        print(f"❌ {fallas} verificaciones de ranking fallaron.")
+        sys.exit(1)
+    print("✅ Ranking verificado.")
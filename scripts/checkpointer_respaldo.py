@@ -0,0 +1,484 @@
+import os
+import glob
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from langgraph.checkpoint.memory import MemorySaver
+
+# Respaldo del checkpointer mientras Postgres no está disponible.
+# A diferencia de MemorySaver a secas (que guarda todos los checkpoints de todas las conversaciones en RAM
+# para siempre), solo mantiene en memoria las CHECKPOINT_RESPALDO_HILOS conversaciones más recientes; el
+# resto se derrama a un SQLite local. Cuando Postgres vuelve, todo se reproduce allí y el respaldo pasa a delegar.
+CHECKPOINT_RESPALDO_HILOS = int(os.getenv("CHECKPOINT_RESPALDO_HILOS", "200"))
+# Checkpoints por thread en RAM: al llegar al doble, los más viejos (con sus blobs) pasan al historial del SQLite
+CHECKPOINT_RESPALDO_POR_HILO = int(os.getenv("CHECKPOINT_RESPALDO_POR_HILO", "20"))
+CHECKPOINT_RESPALDO_DIR = os.getenv("CHECKPOINT_RESPALDO_DIR", "../.tmp")
+# Pasadas del volcado fuera del lock antes de la final (que sí bloquea, pero solo con los threads que cambiaron)
+CHECKPOINT_RESPALDO_PASADAS = int(os.getenv("CHECKPOINT_RESPALDO_PASADAS", "3"))
+
+
+class CheckpointerRespaldo(MemorySaver):
+    """
+    MemorySaver acotado por cantidad de threads (LRU) y de checkpoints por thread, con derrame a SQLite.
+    Las estructuras internas de MemorySaver (storage / writes / blobs) ya guardan los valores serializados:
+    derramar un thread es mover sus entradas, tal cual, a una fila de SQLite.
+    Lo que está en RAM también se anota en el diario del SQLite al escribirse, así que un OOM-kill no pierde nada.
+    Al crearse (y antes de cada volcado) adopta los SQLite que dejaron procesos muertos (reinicio, OOM-kill).
+    """
+
+    def __init__(self, max_hilos: int = CHECKPOINT_RESPALDO_HILOS, ruta: str | None = None,
+                 max_checkpoints: int = CHECKPOINT_RESPALDO_POR_HILO, **kwargs):
+        super().__init__(**kwargs)
+        self.max_hilos = max_hilos
+        self.max_checkpoints = max_checkpoints
+        # Un archivo por proceso: con WORKERS > 0 cada worker tiene su propio respaldo
+        self.ruta = ruta or os.path.join(CHECKPOINT_RESPALDO_DIR, f"checkpoints_respaldo_{os.getpid()}.sqlite")
+        self.destino = None
+        self._lru: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.RLock()
+        self._db: sqlite3.Connection | None = None
+        # Durante un volcado: threads escritos o borrados después de copiarlos (se vuelven a reproducir)
+        self._volcando = False
+        self._sucios: set[str] = set()
+        self._borrados: set[str] = set()
+        # Lotes del historial ya reproducidos en este volcado (son inmutables: no se repiten en las pasadas)
+        self._lotes_volcados: set[int] = set()
+        self.metricas = {"derramados": 0, "rehidratados": 0, "reproducidos": 0, "checkpoints_al_historial": 0, "adoptados": 0}
+        self._adoptar_huerfanos()
+
+    # --- Derrame a disco ---
+
+    def _conexion(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            self._db = sqlite3.connect(self.ruta, check_same_thread=False)
+            # WAL + synchronous=NORMAL: cada anotación del diario es un append barato y sobrevive a la muerte del proceso
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS hilos (thread_id TEXT PRIMARY KEY, datos BLOB NOT NULL)")
+            # Diario de los threads en RAM: cada put/put_writes agrega una fila; _consolidar lo reduce a una sola
+            self._db.execute("CREATE TABLE IF NOT EXISTS diario (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                             "thread_id TEXT NOT NULL, datos BLOB NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS diario_thread ON diario (thread_id)")
+            # Checkpoints viejos de threads activos, por lotes con el mismo formato que `hilos`
+            self._db.execute("CREATE TABLE IF NOT EXISTS historial (lote INTEGER PRIMARY KEY AUTOINCREMENT, "
+                             "thread_id TEXT NOT NULL, datos BLOB NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS historial_thread ON historial (thread_id)")
+            self._db.commit()
+        return self._db
+
+    def _hay_disco(self) -> bool:
+        return self._db is not None or os.path.exists(self.ruta)
+
+    def _hilos_en_disco(self) -> list[str]:
+        if not self._hay_disco():
+            return []
+        return [fila[0] for fila in self._conexion().execute("SELECT thread_id FROM hilos UNION SELECT thread_id FROM historial")]
+
+    def _extraer(self, thread_id: str) -> dict:
+        """Saca de memoria todo lo del thread. Se copian a dicts planos (storage usa un defaultdict con lambda)."""
+        storage = {ns: dict(checkpoints) for ns, checkpoints in self.storage.pop(thread_id, {}).items()}
+        writes = {k: self.writes.pop(k) for k in [k for k in self.writes if k[0] == thread_id]}
+        blobs = {k: self.blobs.pop(k) for k in [k for k in self.blobs if k[0] == thread_id]}
+        return {"storage": storage, "writes": writes, "blobs": blobs}
+
+    def _derramar(self, thread_id: str):
+        datos = self._extraer(thread_id)
+        db = self._conexion()
+        db.execute("INSERT OR REPLACE INTO hilos (thread_id, datos) VALUES (?, ?)",
+                   (thread_id, pickle.dumps(datos, protocol=pickle.HIGHEST_PROTOCOL)))
+        db.execute("DELETE FROM diario WHERE thread_id = ?", (thread_id,))
+        db.commit()
+        self.metricas["derramados"] += 1
+
+    def _anotar(self, thread_id: str, datos: dict):
+        """Agrega al diario lo que se acaba de escribir en RAM (mismo formato que una fila de `hilos`)."""
+        db = self._conexion()
+        db.execute("INSERT INTO diario (thread_id, datos) VALUES (?, ?)",
+                   (thread_id, pickle.dumps(datos, protocol=pickle.HIGHEST_PROTOCOL)))
+        db.commit()
+
+    def _consolidar(self, thread_id: str):
+        """Reemplaza el diario del thread (y su fila de `hilos`, si venía de disco) por una foto de lo que hay en RAM."""
+        if thread_id not in self._lru:
+            return
+        datos = {
+            "storage": {ns: dict(checkpoints) for ns, checkpoints in self.storage.get(thread_id, {}).items()},
+            "writes": {k: dict(v) for k, v in self.writes.items() if k[0] == thread_id},
+            "blobs": {k: v for k, v in self.blobs.items() if k[0] == thread_id},
+        }
+        db = self._conexion()
+        db.execute("DELETE FROM diario WHERE thread_id = ?", (thread_id,))
+        db.execute("DELETE FROM hilos WHERE thread_id = ?", (thread_id,))
+        db.execute("INSERT INTO diario (thread_id, datos) VALUES (?, ?)",
+                   (thread_id, pickle.dumps(datos, protocol=pickle.HIGHEST_PROTOCOL)))
+        db.commit()
+
+    def _cargar(self, thread_id: str, datos: dict):
+        for ns, checkpoints in datos["storage"].items():
+            self.storage[thread_id][ns].update(checkpoints)
+        self.writes.update(datos["writes"])
+        self.blobs.update(datos["blobs"])
+
+    def _rehidratar(self, thread_id: str) -> bool:
+        """Trae el thread de `hilos` a RAM. La fila se borra recién al consolidarlo en el diario (ver _tocar)."""
+        if not self._hay_disco():
+            return False
+        fila = self._conexion().execute("SELECT datos FROM hilos WHERE thread_id = ?", (thread_id,)).fetchone()
+        if fila is None:
+            return False
+        self._cargar(thread_id, pickle.loads(fila[0]))
+        self.metricas["rehidratados"] += 1
+        return True
+
+    def _recortar(self, thread_id: str) -> bool:
+        """
+        Un thread muy activo acumula un checkpoint por paso. Al pasar de 2 × max_checkpoints, los más viejos van al
+        historial del SQLite junto con sus escrituras y todos sus blobs (el lote se puede reproducir solo). De la RAM
+        salen los blobs que ya no usa ningún checkpoint retenido. Devuelve si movió algo (y consolidó el diario).
+        """
+        recortado = False
+        for ns, checkpoints in self.storage.get(thread_id, {}).items():
+            if len(checkpoints) <= 2 * self.max_checkpoints:
+                continue
+            ids = sorted(checkpoints)
+            viejos, retenidos = ids[:-self.max_checkpoints], ids[-self.max_checkpoints:]
+            en_uso = {
+                (canal, version)
+                for checkpoint_id in retenidos
+                for canal, version in self.serde.loads_typed(checkpoints[checkpoint_id][0]).get("channel_versions", {}).items()
+            }
+            lote = {"storage": {ns: {}}, "writes": {}, "blobs": {}}
+            for checkpoint_id in viejos:
+                registro = checkpoints.pop(checkpoint_id)
+                lote["storage"][ns][checkpoint_id] = registro
+                clave = (thread_id, ns, checkpoint_id)
+                if clave in self.writes:
+                    lote["writes"][clave] = self.writes.pop(clave)
+                for canal, version in self.serde.loads_typed(registro[0]).get("channel_versions", {}).items():
+                    clave_blob = (thread_id, ns, canal, version)
+                    if clave_blob in self.blobs:
+                        lote["blobs"][clave_blob] = self.blobs[clave_blob]
+            for clave_blob in lote["blobs"]:
+                if clave_blob[2:] not in en_uso:
+                    self.blobs.pop(clave_blob, None)
+            db = self._conexion()
+            db.execute("INSERT INTO historial (thread_id, datos) VALUES (?, ?)",
+                       (thread_id, pickle.dumps(lote, protocol=pickle.HIGHEST_PROTOCOL)))
+            db.commit()
+            self.metricas["checkpoints_al_historial"] += len(viejos)
+            recortado = True
+        if recortado:
+            # El diario todavía tiene los checkpoints que pasaron al historial
+            self._consolidar(thread_id)
+        return recortado
+
+    # --- Respaldos de procesos muertos ---
+
+    def _archivos_huerfanos(self) -> list[str]:
+        """SQLite de respaldo de procesos que ya no existen (o a medio adoptar por este mismo proceso)."""
+        patron = os.path.join(os.path.dirname(os.path.abspath(self.ruta)), "checkpoints_respaldo_*.sqlite")
+        archivos = []
+        for ruta in glob.glob(patron) + glob.glob(patron + ".adoptando.*"):
+            if os.path.abspath(ruta) == os.path.abspath(self.ruta):
+                continue
+            if ".adoptando." in ruta:
+                dueno = ruta.rsplit(".", 1)[-1]
+            else:
+                dueno = os.path.basename(ruta)[len("checkpoints_respaldo_"):-len(".sqlite")]
+            # El de un proceso vivo es su respaldo en uso (o lo está adoptando él)
+            if dueno.isdigit() and int(dueno) != os.getpid() and _proceso_vivo(int(dueno)):
+                continue
+            archivos.append(ruta)
+        return sorted(archivos, key=lambda r: os.path.getmtime(r) if os.path.exists(r) else 0)
+
+    def _adoptar_huerfanos(self) -> int:
+        """
+        Suma a este respaldo los SQLite de procesos muertos: sus conversaciones se fusionan con las propias y se
+        reproducen en Postgres en el próximo volcado. Cada archivo se reclama renombrándolo (si otro proceso lo
+        reclamó antes, el rename falla). Fusionar dos veces lo mismo es inocuo: los checkpoints tienen id propio.
+        """
+        adoptados = 0
+        with self._lock:
+            for ruta in self._archivos_huerfanos():
+                reclamado = ruta if ruta.endswith(f".adoptando.{os.getpid()}") else f"{ruta.split('.adoptando.')[0]}.adoptando.{os.getpid()}"
+                try:
+                    if ruta != reclamado:
+                        os.replace(ruta, reclamado)
+                        # Un journal caliente (el proceso murió a mitad de una transacción) viaja con su base
+                        for sufijo in ("-journal", "-wal", "-shm"):
+                            if os.path.exists(ruta + sufijo):
+                                os.replace(ruta + sufijo, reclamado + sufijo)
+                except FileNotFoundError:
+                    continue
+                try:
+                    origen = sqlite3.connect(reclamado)
+                    try:
+                        tablas = {fila[0] for fila in origen.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+                        hilos = set()
+                        if "historial" in tablas:
+                            db = self._conexion()
+                            for thread_id, datos in origen.execute("SELECT thread_id, datos FROM historial ORDER BY lote"):
+                                db.execute("INSERT INTO historial (thread_id, datos) VALUES (?, ?)", (thread_id, datos))
+                                hilos.add(thread_id)
+                            db.commit()
+                        por_hilo: dict[str, list[dict]] = {}
+                        if "hilos" in tablas:
+                            for thread_id, datos in origen.execute("SELECT thread_id, datos FROM hilos"):
+                                por_hilo.setdefault(thread_id, []).append(pickle.loads(datos))
+                        if "diario" in tablas:
+                            for thread_id, datos in origen.execute("SELECT thread_id, datos FROM diario ORDER BY id"):
+                                por_hilo.setdefault(thread_id, []).append(pickle.loads(datos))
+                        for thread_id, anotaciones in por_hilo.items():
+                            self._tocar(thread_id)
+                            for datos in anotaciones:
+                                self._cargar(thread_id, datos)
+                            if not self._recortar(thread_id):
+                                self._consolidar(thread_id)
+                            self._marcar(thread_id)
+                            hilos.add(thread_id)
+                    finally:
+                        origen.close()
+                    for sufijo in ("", "-journal", "-wal", "-shm"):
+                        if os.path.exists(reclamado + sufijo):
+                            os.remove(reclamado + sufijo)
+                    adoptados += len(hilos)
+                    print(f"♻️ Respaldo de checkpoints de un proceso anterior adoptado: {os.path.basename(ruta)} ({len(hilos)} conversaciones)")
+                except Exception as e:
+                    # Queda reclamado por este proceso: se reintenta en el próximo volcado
+                    print(f"⚠️ No se pudo adoptar el respaldo {reclamado}: {e}")
+            self.metricas["adoptados"] += adoptados
+        return adoptados
+
+    def _marcar(self, thread_id: str, borrado: bool = False):
+        if self._volcando:
+            self._sucios.add(thread_id)
+            if borrado:
+                self._borrados.add(thread_id)
+
+    def _tocar(self, thread_id: str):
+        """Marca el thread como recién usado (trayéndolo de disco si hace falta) y derrama los más fríos."""
+        if thread_id in self._lru:
+            self._lru.move_to_end(thread_id)
+            return
+        rehidratado = self._rehidratar(thread_id)
+        self._lru[thread_id] = None
+        if rehidratado:
+            self._consolidar(thread_id)
+        while len(self._lru) > self.max_hilos:
+            frio, _ = self._lru.popitem(last=False)
+            self._derramar(frio)
+
+    # --- API del checkpointer (las versiones async de MemorySaver llaman a estas) ---
+
+    def get_tuple(self, config):
+        with self._lock:
+            if self.destino is not None:
+                return self.destino.get_tuple(config)
+            self._tocar(config["configurable"]["thread_id"])
+            return super().get_tuple(config)
+
+    def list(self, config, **kwargs):
+        with self._lock:
+            if self.destino is not None:
+                return self.destino.list(config, **kwargs)
+            # Sin config solo se listan los threads en memoria (los derramados no se rehidratan en masa)
+            if config:
+                self._tocar(config["configurable"]["thread_id"])
+            # Se materializa dentro del lock: un generador vivo podría ver el thread derramado a mitad de camino
+            return iter(list(super().list(config, **kwargs)))
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            if self.destino is not None:
+                return self.destino.put(config, checkpoint, metadata, new_versions)
+            self._tocar(config["configurable"]["thread_id"])
+            self._marcar(config["configurable"]["thread_id"])
+            siguiente = super().put(config, checkpoint, metadata, new_versions)
+            thread_id, ns = config["configurable"]["thread_id"], config["configurable"]["checkpoint_ns"]
+            if not self._recortar(thread_id):
+                self._anotar(thread_id, {
+                    "storage": {ns: {checkpoint["id"]: self.storage[thread_id][ns][checkpoint["id"]]}},
+                    "writes": {},
+                    "blobs": {(thread_id, ns, canal, version): self.blobs[(thread_id, ns, canal, version)]
+                              for canal, version in new_versions.items()},
+                })
+            return siguiente
+
+    def put_writes(self, config, writes, task_id, task_path: str = ""):
+        with self._lock:
+            if self.destino is not None:
+                return self.destino.put_writes(config, writes, task_id, task_path)
+            self._tocar(config["configurable"]["thread_id"])
+            self._marcar(config["configurable"]["thread_id"])
+            resultado = super().put_writes(config, writes, task_id, task_path)
+            clave = (config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", ""),
+                     config["configurable"]["checkpoint_id"])
+            # Va el dict entero de escrituras del checkpoint: al reaplicar el diario, la última anotación manda
+            self._anotar(clave[0], {"storage": {}, "writes": {clave: dict(self.writes[clave])}, "blobs": {}})
+            return resultado
+
+    def get_delta_channel_history(self, *, config, channels):
+        with self._lock:
+            if self.destino is not None:
+                return self.destino.get_delta_channel_history(config=config, channels=channels)
+            self._tocar(config["configurable"]["thread_id"])
+            return super().get_delta_channel_history(config=config, channels=channels)
+
+    def delete_thread(self, thread_id: str):
+        with self._lock:
+            if self.destino is not None:
+                return self.destino.delete_thread(thread_id)
+            self._lru.pop(thread_id, None)
+            self._marcar(thread_id, borrado=True)
+            if self._hay_disco():
+                self._conexion().execute("DELETE FROM hilos WHERE thread_id = ?", (thread_id,))
+                self._conexion().execute("DELETE FROM historial WHERE thread_id = ?", (thread_id,))
+                self._conexion().execute("DELETE FROM diario WHERE thread_id = ?", (thread_id,))
+                self._conexion().commit()
+            return super().delete_thread(thread_id)
+
+    # --- Reproducción en Postgres ---
+
+    def _copiar(self, thread_id: str) -> tuple:
+        """
+        Foto del thread: (¿se borró desde la última copia?, lotes de su historial en disco, checkpoints en RAM
+        del más viejo al más nuevo). Se llama con el lock tomado.
+        """
+        borrado = thread_id in self._borrados
+        self._borrados.discard(thread_id)
+        self._tocar(thread_id)
+        lotes = [fila[0] for fila in self._conexion().execute(
+            "SELECT lote FROM historial WHERE thread_id = ? ORDER BY lote", (thread_id,))] if self._hay_disco() else []
+        return borrado, lotes, list(reversed(list(MemorySaver.list(self, {"configurable": {"thread_id": thread_id}}))))
+
+    def _leer_lote(self, thread_id: str, lote: int) -> list:
+        """Checkpoints de un lote del historial, del más viejo al más nuevo (se arman en un MemorySaver aparte)."""
+        with self._lock:
+            fila = self._conexion().execute("SELECT datos FROM historial WHERE lote = ?", (lote,)).fetchone()
+        if fila is None:
+            return []
+        temporal = MemorySaver(serde=self.serde)
+        datos = pickle.loads(fila[0])
+        for ns, checkpoints in datos["storage"].items():
+            temporal.storage[thread_id][ns].update(checkpoints)
+        temporal.writes.update(datos["writes"])
+        temporal.blobs.update(datos["blobs"])
+        return list(reversed(list(temporal.list({"configurable": {"thread_id": thread_id}}))))
+
+    def _reproducir(self, thread_id: str, foto: tuple, destino):
+        """Copia la foto del thread al destino (primero su historial, lote por lote) con sus escrituras pendientes."""
+        borrado, lotes, tuplas = foto
+        if borrado:
+            # Lo que ya se había copiado antes del borrado no debe quedar en Postgres
+            destino.delete_thread(thread_id)
+        for lote in lotes:
+            if lote in self._lotes_volcados:
+                continue
+            self._escribir(thread_id, self._leer_lote(thread_id, lote), destino)
+            self._lotes_volcados.add(lote)
+        self._escribir(thread_id, tuplas, destino)
+
+    def _escribir(self, thread_id: str, tuplas: list, destino):
+        for tupla in tuplas:
+            config_padre = tupla.parent_config or {
+                "configurable": {"thread_id": thread_id, "checkpoint_ns": tupla.config["configurable"].get("checkpoint_ns", "")}
+            }
+            destino.put(config_padre, tupla.checkpoint, tupla.metadata, tupla.checkpoint.get("channel_versions", {}))
+            por_tarea: dict[str, list] = {}
+            for task_id, canal, valor in tupla.pending_writes or []:
+                por_tarea.setdefault(task_id, []).append((canal, valor))
+            for task_id, escrituras in por_tarea.items():
+                destino.put_writes(tupla.config, escrituras, task_id)
+
+    def volcar_en(self, destino) -> int:
+        """
+        Reproduce todas las conversaciones (en memoria y derramadas) en `destino` y desde ahí delega en él.
+        Cada thread se copia con el lock tomado y se escribe en Postgres fuera de él: los turnos siguen mientras
+        tanto, y lo que escriban marca su thread como sucio. Tras CHECKPOINT_RESPALDO_PASADAS pasadas sobre los
+        sucios, la última se hace con el lock tomado (solo esos threads) y recién ahí se pasa a delegar.
+        Si falla, el respaldo queda como estaba (puede reintentarse; los puts en Postgres son idempotentes).
+        """
+        with self._lock:
+            # Lo que dejaron procesos que murieron durante la caída también va a Postgres
+            self._adoptar_huerfanos()
+            hilos = list(dict.fromkeys(list(self._lru) + self._hilos_en_disco()))
+            self._volcando = True
+            self._sucios.clear()
+            self._borrados.clear()
+            self._lotes_volcados.clear()
+        try:
+            pendientes = hilos
+            for _ in range(CHECKPOINT_RESPALDO_PASADAS):
+                for thread_id in pendientes:
+                    with self._lock:
+                        foto = self._copiar(thread_id)
+                    self._reproducir(thread_id, foto, destino)
+                    self.metricas["reproducidos"] += 1
+                with self._lock:
+                    pendientes = list(self._sucios)
+                    self._sucios.clear()
+                if not pendientes:
+                    break
+        except BaseException:
+            with self._lock:
+                self._volcando = False
+            raise
+
+        with self._lock:
+            try:
+                finales = list(dict.fromkeys(pendientes + list(self._sucios)))
+                for thread_id in finales:
+                    self._reproducir(thread_id, self._copiar(thread_id), destino)
+                    self.metricas["reproducidos"] += 1
+            finally:
+                self._volcando = False
+                self._sucios.clear()
+                self._borrados.clear()
+                self._lotes_volcados.clear()
+            hilos = list(dict.fromkeys(hilos + finales))
+
+            self.destino = destino
+            self.storage.clear()
+            self.writes.clear()
+            self.blobs.clear()
+            self._lru.clear()
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+            for sufijo in ("", "-wal", "-shm"):
+                if os.path.exists(self.ruta + sufijo):
+                    os.remove(self.ruta + sufijo)
+            return len(hilos)
+
+    def estado(self) -> dict:
+        with self._lock:
+            return {
+                **self.metricas,
+                "modo": "delegando" if self.destino is not None else "respaldo",
+                "hilos_en_memoria": len(self._lru),
+                "hilos_en_disco": len(self._hilos_en_disco()) if self.destino is None else 0,
+            }
+
+
+def _proceso_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def volcar_huerfanos(destino, serde=None) -> int:
+    """
+    Con Postgres disponible desde el arranque no se crea un respaldo, pero puede haber SQLite de una caída anterior
+    (el contenedor se reinició o el proceso murió con Postgres caído). Los reproduce en `destino` y los borra.
+    """
+    respaldo = CheckpointerRespaldo(serde=serde)
+    if not respaldo._lru and not respaldo._hilos_en_disco():
+        return 0
+    return respaldo.volcar_en(destino)
@@ -0,0 +1,184 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+import concurrent.futures
+from collections import deque
+
+import trazas
+
+# Cobertura (hedging) de las llamadas al LLM: si la llamada principal no volvió al cumplirse el umbral adaptativo
+# (el percentil LLM_COBERTURA_PERCENTIL de las latencias recientes), se lanza una segunda idéntica; gana la primera
+# que responde y la otra se cancela (al cancelar la tarea, httpx cierra la conexión y OpenAI deja de generar).
+# Cuesta tokens extra: LLM_COBERTURA_TASA_MAXIMA acota qué fracción de las llamadas puede cubrirse.
+LLM_COBERTURA = os.getenv("LLM_COBERTURA", "0") == "1"
+LLM_COBERTURA_PERCENTIL = float(os.getenv("LLM_COBERTURA_PERCENTIL", "0.9"))
+LLM_COBERTURA_TASA_MAXIMA = float(os.getenv("LLM_COBERTURA_TASA_MAXIMA", "0.1"))
+LLM_COBERTURA_VENTANA = int(os.getenv("LLM_COBERTURA_VENTANA", "200"))           # llamadas recordadas (latencias y tasa)
+LLM_COBERTURA_MUESTRAS_MINIMAS = int(os.getenv("LLM_COBERTURA_MUESTRAS_MINIMAS", "20"))
+LLM_COBERTURA_UMBRAL_INICIAL = float(os.getenv("LLM_COBERTURA_UMBRAL_INICIAL", "8"))  # segundos, hasta tener muestras
+LLM_COBERTURA_UMBRAL_MINIMO = float(os.getenv("LLM_COBERTURA_UMBRAL_MINIMO", "1"))
+
+
+class Cobertura:
+    """Umbral adaptativo, tope de tasa y la carrera principal/cobertura sobre cualquier runnable con `ainvoke`."""
+
+    def __init__(self, percentil: float = LLM_COBERTURA_PERCENTIL, tasa_maxima: float = LLM_COBERTURA_TASA_MAXIMA,
+                 ventana: int = LLM_COBERTURA_VENTANA):
+        self.percentil = percentil
+        self.tasa_maxima = tasa_maxima
+        self._latencias: deque[float] = deque(maxlen=ventana)
+        self._cubiertas: deque[bool] = deque(maxlen=ventana)
+        self._lock = threading.Lock()
+        self.metricas = {"llamadas": 0, "cubiertas": 0, "ganadas_por_cobertura": 0, "sin_cupo": 0, "errores": 0}
+
+    def umbral(self) -> float:
+        with self._lock:
+            if len(self._latencias) < LLM_COBERTURA_MUESTRAS_MINIMAS:
+                return LLM_COBERTURA_UMBRAL_INICIAL
+            ordenadas = sorted(self._latencias)
+        return max(LLM_COBERTURA_UMBRAL_MINIMO, ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * self.percentil))])
+
+    def _hay_cupo(self) -> bool:
+        with self._lock:
+            if not self._cubiertas:
+                return self.tasa_maxima > 0
+            return (sum(self._cubiertas) + 1) / (len(self._cubiertas) + 1) <= self.tasa_maxima
+
+    def _registrar(self, latencia: float | None, cubierta: bool, gano_cobertura: bool):
+        with self._lock:
+            self.metricas["llamadas"] += 1
+            self._cubiertas.append(cubierta)
+            if cubierta:
+                self.metricas["cubiertas"] += 1
+            if gano_cobertura:
+                self.metricas["ganadas_por_cobertura"] += 1
+            # Solo latencias de solicitudes completas (una principal cancelada no dice cuánto habría tardado)
+            if latencia is not None:
+                self._latencias.append(latencia)
+
+    async def correr(self, llm, mensajes, timeout: float | None = None, permiso_extra=None, **kwargs):
+        """
+        Carrera principal/cobertura. Devuelve (respuesta, detalle) con detalle = {"cubierta", "ganador", "umbral"}.
+        `permiso_extra()` (opcional) se consulta antes de lanzar la cobertura: el planificador global puede negarla.
+        """
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        umbral = self.umbral()
+
+        async def solicitud():
+            inicio = time.perf_counter()
+            respuesta = await llm.ainvoke(mensajes, **kwargs)
+            return respuesta, time.perf_counter() - inicio
+
+        principal = asyncio.create_task(solicitud())
+        hechas, _ = await asyncio.wait({principal}, timeout=umbral)
+        # Sin margen para una segunda llamada completa no tiene sentido cubrir
+        sin_margen = timeout is not None and timeout - umbral < LLM_COBERTURA_UMBRAL_MINIMO
+        if hechas or sin_margen or not self._hay_cupo() or (permiso_extra is not None and not permiso_extra()):
+            if not hechas and not sin_margen:
+                with self._lock:
+                    self.metricas["sin_cupo"] += 1
+            try:
+                respuesta, latencia = await principal
+            except Exception:
+                self._registrar(None, False, False)
+                with self._lock:
+                    self.metricas["errores"] += 1
+                raise
+            self._registrar(latencia, False, False)
+            return respuesta, {"cubierta": False, "ganador": "principal", "umbral": round(umbral, 3)}
+
+        if timeout is not None:
+            kwargs["timeout"] = timeout - umbral
+        cobertura = asyncio.create_task(solicitud())
+        pendientes = {principal, cobertura}
+        primer_error = None
+        try:
+            while pendientes:
+                hechas, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+                for tarea in hechas:
+                    if tarea.exception() is not None:
+                        primer_error = primer_error or tarea.exception()
+                        continue
+                    respuesta, latencia = tarea.result()
+                    gano_cobertura = tarea is cobertura
+                    self._registrar(latencia, True, gano_cobertura)
+                    return respuesta, {"cubierta": True, "ganador": "cobertura" if gano_cobertura else "principal",
+                                       "umbral": round(umbral, 3)}
+            self._registrar(None, True, False)
+            with self._lock:
+                self.metricas["errores"] += 1
+            raise primer_error
+        finally:
+            # La perdedora se cancela: httpx corta la conexión y OpenAI deja de generar (y de facturar) la salida
+            for tarea in pendientes:
+                tarea.cancel()
+
+    def estado(self) -> dict:
+        umbral = self.umbral()
+        with self._lock:
+            return {
+                "activa": LLM_COBERTURA,
+                "umbral_segundos": round(umbral, 3),
+                "muestras": len(self._latencias),
+                "tasa_cubiertas_ventana": round(sum(self._cubiertas) / len(self._cubiertas), 3) if self._cubiertas else 0.0,
+                "tasa_maxima": self.tasa_maxima,
+                **self.metricas,
+            }
+
+
+cobertura = Cobertura()
+
+# Bucle de eventos propio para las llamadas cubiertas: los nodos del grafo son síncronos (corren en hilos) y el
+# cliente async de OpenAI tiene que vivir siempre en el mismo bucle para reutilizar sus conexiones.
+_bucle: asyncio.AbstractEventLoop | None = None
+_bucle_lock = threading.Lock()
+
+
+def _obtener_bucle() -> asyncio.AbstractEventLoop:
+    global _bucle
+    if _bucle is None:
+        with _bucle_lock:
+            if _bucle is None:
+                bucle = asyncio.new_event_loop()
+                threading.Thread(target=bucle.run_forever, name="bucle-llm", daemon=True).start()
+                _bucle = bucle
+    return _bucle
+
+
+def _en_bucle(corrutina) -> concurrent.futures.Future:
+    """Corre la corrutina en el bucle del LLM con el contexto del hilo que llama (tenant, span actual)."""
+    futuro: concurrent.futures.Future = concurrent.futures.Future()
+    contexto = contextvars.copy_context()
+
+    def terminar(tarea: asyncio.Task):
+        if tarea.cancelled():
+            futuro.cancel()
+        elif tarea.exception() is not None:
+            futuro.set_exception(tarea.exception())
+        else:
+            futuro.set_result(tarea.result())
+
+    def lanzar():
+        tarea = bucle.create_task(corrutina, context=contexto)
+        tarea.add_done_callback(terminar)
+
+    bucle = _obtener_bucle()
+    bucle.call_soon_threadsafe(lanzar)
+    return futuro
+
+
+def invocar(llm, mensajes, timeout: float | None = None, permiso_extra=None, **kwargs):
+    """
+    Reemplazo de `llm.invoke(mensajes, timeout=...)` para código síncrono.
+    Con LLM_COBERTURA apagado es exactamente esa llamada.
+    """
+    if not LLM_COBERTURA:
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        return llm.invoke(mensajes, **kwargs)
+    respuesta, detalle = _en_bucle(cobertura.correr(llm, mensajes, timeout, permiso_extra, **kwargs)).result()
+    trazas.anotar(llm_cubierta=detalle["cubierta"], llm_ganador=detalle["ganador"], llm_umbral=detalle["umbral"])
+    return respuesta
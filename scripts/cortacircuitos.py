@@ -0,0 +1,250 @@
+import os
+import time
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from typing import Callable
+
+from tenants import tenant_actual
+import trazas
+
+# Cortacircuitos por integración (Sheets, Cal.com) y por cliente.
+# Cuando una integración se degrada, cada tool esperaba su timeout completo en todas las conversaciones a la vez.
+# Con el circuito abierto las llamadas fallan al instante (o sirven el último resultado bueno, donde es seguro)
+# y un hilo en segundo plano sondea la integración hasta que vuelve.
+CORTACIRCUITOS_FALLAS = int(os.getenv("CORTACIRCUITOS_FALLAS", "5"))                        # fallas mínimas en la ventana
+CORTACIRCUITOS_PROPORCION = float(os.getenv("CORTACIRCUITOS_PROPORCION", "0.5"))            # y al menos esta fracción de fallas
+CORTACIRCUITOS_VENTANA_SEGUNDOS = float(os.getenv("CORTACIRCUITOS_VENTANA_SEGUNDOS", "60"))
+CORTACIRCUITOS_ESPERA_SEGUNDOS = float(os.getenv("CORTACIRCUITOS_ESPERA_SEGUNDOS", "15"))   # primera sonda tras abrir
+CORTACIRCUITOS_ESPERA_MAXIMA = float(os.getenv("CORTACIRCUITOS_ESPERA_MAXIMA", "300"))      # tope del backoff entre sondas
+# Un timeout con menos presupuesto que esto lo causó el plazo del turno, no la integración: no cuenta como falla
+CORTACIRCUITOS_TIMEOUT_MINIMO = float(os.getenv("CORTACIRCUITOS_TIMEOUT_MINIMO", "5"))
+CORTACIRCUITOS_TIMEOUT_SONDA = float(os.getenv("CORTACIRCUITOS_TIMEOUT_SONDA", "5"))
+
+CERRADO, ABIERTO, SEMIABIERTO = "cerrado", "abierto", "semiabierto"
+
+
+class CircuitoAbierto(Exception):
+    """La integración está marcada como caída: la llamada no se intentó."""
+
+    def __init__(self, nombre: str, proxima_sonda: float):
+        super().__init__(f"{nombre}: circuito abierto (próxima sonda en {max(0, proxima_sonda - time.time()):.0f}s)")
+        self.nombre = nombre
+
+
+def es_falla_del_servicio(error: Exception, timeout: float | None = None) -> bool | None:
+    """
+    True si el error habla de la salud de la integración (5xx, 429, timeout, conexión), False si la integración
+    respondió (4xx: pedido inválido, slot ocupado...) y None si no se puede saber (error nuestro al procesar la respuesta).
+    """
+    # requests: error.response.status_code · googleapiclient: error.resp.status
+    status = getattr(getattr(error, "response", None), "status_code", None) or getattr(getattr(error, "resp", None), "status", None)
+    if status is not None:
+        return int(status) >= 500 or int(status) == 429
+    if "timeout" in type(error).__name__.lower():
+        return timeout is None or timeout >= CORTACIRCUITOS_TIMEOUT_MINIMO
+    if isinstance(error, OSError) or type(error).__module__.startswith("httplib2"):
+        return True
+    return None
+
+
+class CortaCircuitos:
+    """
+    cerrado -> abierto: CORTACIRCUITOS_FALLAS fallas (y CORTACIRCUITOS_PROPORCION del total) en la ventana.
+    abierto -> semiabierto: a los `espera` segundos el hilo de sondeo prueba la integración con `sonda`.
+    semiabierto -> cerrado si la sonda anda; si no, vuelve a abierto con el doble de espera.
+    Sin sonda, en semiabierto se deja pasar una sola llamada real como prueba.
+    """
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.estado = CERRADO
+        self._resultados: deque[tuple[float, bool]] = deque()
+        self._lock = threading.Lock()
+        self._sonda: tuple[Callable, contextvars.Context] | None = None
+        self._espera = CORTACIRCUITOS_ESPERA_SEGUNDOS
+        self._proxima_sonda = 0.0
+        self._prueba_en_vuelo = False
+        self.metricas = {"exitos": 0, "fallas": 0, "rechazadas": 0, "aperturas": 0, "sondas_fallidas": 0}
+        self.ultimo_error = ""
+        self.cambio_estado = time.time()
+
+    def fijar_sonda(self, sonda: Callable):
+        """Llamada liviana y sin efectos para probar la integración. Corre en el contexto (tenant) de quien la fija."""
+        with self._lock:
+            self._sonda = (sonda, contextvars.copy_context())
+
+    def _cambiar(self, estado: str):
+        self.estado = estado
+        self.cambio_estado = time.time()
+
+    def _podar(self, ahora: float):
+        while self._resultados and ahora - self._resultados[0][0] > CORTACIRCUITOS_VENTANA_SEGUNDOS:
+            self._resultados.popleft()
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self.estado == CERRADO:
+                return True
+            if self.estado == SEMIABIERTO and self._sonda is None and not self._prueba_en_vuelo:
+                self._prueba_en_vuelo = True
+                return True
+            self.metricas["rechazadas"] += 1
+            return False
+
+    def registrar_exito(self):
+        with self._lock:
+            self.metricas["exitos"] += 1
+            if self.estado != CERRADO:
+                print(f"✅ Circuito {self.nombre} cerrado: la integración respondió.")
+                self._cerrar()
+            ahora = time.time()
+            self._resultados.append((ahora, True))
+            self._podar(ahora)
+
+    def registrar_falla(self, error: Exception):
+        with self._lock:
+            self.metricas["fallas"] += 1
+            self.ultimo_error = f"{type(error).__name__}: {error}"[:300]
+            if self.estado == SEMIABIERTO:
+                self._abrir(duplicar=True)
+                return
+            if self.estado == ABIERTO:
+                return
+            ahora = time.time()
+            self._resultados.append((ahora, False))
+            self._podar(ahora)
+            fallas = sum(1 for _, exito in self._resultados if not exito)
+            if fallas >= CORTACIRCUITOS_FALLAS and fallas / len(self._resultados) >= CORTACIRCUITOS_PROPORCION:
+                self._abrir()
+
+    def _cerrar(self):
+        self._cambiar(CERRADO)
+        self._resultados.clear()
+        self._espera = CORTACIRCUITOS_ESPERA_SEGUNDOS
+        self._prueba_en_vuelo = False
+
+    def _abrir(self, duplicar: bool = False):
+        """Se llama con el lock tomado."""
+        if duplicar:
+            self._espera = min(self._espera * 2, CORTACIRCUITOS_ESPERA_MAXIMA)
+        else:
+            self.metricas["aperturas"] += 1
+            print(f"🔌 Circuito {self.nombre} abierto: fallas repetidas ({self.ultimo_error}). Fallando rápido por {self._espera:.0f}s.")
+        self._cambiar(ABIERTO)
+        self._prueba_en_vuelo = False
+        self._proxima_sonda = time.time() + self._espera
+        threading.Thread(target=self._sondear, args=(self._proxima_sonda,), name=f"sonda-{self.nombre}", daemon=True).start()
+
+    def _sondear(self, cuando: float):
+        time.sleep(max(0.0, cuando - time.time()))
+        with self._lock:
+            if self.estado != ABIERTO or self._proxima_sonda != cuando:
+                return
+            self._cambiar(SEMIABIERTO)
+            sonda = self._sonda
+        if sonda is None:
+            # Sin sonda: la próxima llamada real hace de prueba (permitir)
+            return
+        funcion, contexto = sonda
+        try:
+            contexto.copy().run(funcion)
+        except Exception as e:
+            with self._lock:
+                self.metricas["sondas_fallidas"] += 1
+                self.ultimo_error = f"{type(e).__name__}: {e}"[:300]
+                print(f"⚠️ Sonda de {self.nombre} falló ({self.ultimo_error}). Próxima en {min(self._espera * 2, CORTACIRCUITOS_ESPERA_MAXIMA):.0f}s.")
+                self._abrir(duplicar=True)
+            return
+        self.registrar_exito()
+
+    def ejecutar(self, funcion: Callable, timeout: float | None = None):
+        """
+        Corre `funcion` (sin argumentos) a través del circuito. Con el circuito abierto levanta CircuitoAbierto sin llamar.
+        `timeout` es el que se le dio a la llamada: decide si un timeout cuenta como falla de la integración.
+        """
+        if not self.permitir():
+            trazas.anotar(circuito=self.nombre, circuito_estado=self.estado)
+            raise CircuitoAbierto(self.nombre, self._proxima_sonda)
+        try:
+            resultado = funcion()
+        except Exception as e:
+            falla = es_falla_del_servicio(e, timeout)
+            if falla:
+                self.registrar_falla(e)
+            elif falla is False:
+                self.registrar_exito()
+            else:
+                with self._lock:
+                    self._prueba_en_vuelo = False
+            raise
+        self.registrar_exito()
+        return resultado
+
+    def resumen(self) -> dict:
+        with self._lock:
+            ahora = time.time()
+            self._podar(ahora)
+            return {
+                "estado": self.estado,
+                "desde": round(ahora - self.cambio_estado, 1),
+                "fallas_en_ventana": sum(1 for _, exito in self._resultados if not exito),
+                "llamadas_en_ventana": len(self._resultados),
+                "proxima_sonda_en": round(max(0.0, self._proxima_sonda - ahora), 1) if self.estado == ABIERTO else None,
+                "ultimo_error": self.ultimo_error,
+                **self.metricas,
+            }
+
+
+_circuitos: dict[str, CortaCircuitos] = {}
+_circuitos_lock = threading.Lock()
+
+
+def circuito(integracion: str, sonda: Callable | None = None) -> CortaCircuitos:
+    """Circuito de `integracion` para el cliente actual (un Cal.com caído de un cliente no corta a los demás)."""
+    nombre = f"{integracion}:{tenant_actual.get()['id']}"
+    with _circuitos_lock:
+        cc = _circuitos.get(nombre)
+        if cc is None:
+            cc = _circuitos[nombre] = CortaCircuitos(nombre)
+    if sonda is not None and cc._sonda is None:
+        cc.fijar_sonda(sonda)
+    return cc
+
+
+def resumen() -> dict[str, dict]:
+    with _circuitos_lock:
+        circuitos = list(_circuitos.values())
+    return {cc.nombre: cc.resumen() for cc in circuitos}
+
+
+class UltimoBueno:
+    """Últimos resultados buenos por clave (LRU acotada), para servirlos marcados como viejos con el circuito abierto."""
+
+    def __init__(self, maximo: int = 256):
+        self.maximo = maximo
+        self._valores: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._valores[clave] = (time.time(), valor)
+            self._valores.move_to_end(clave)
+            while len(self._valores) > self.maximo:
+                self._valores.popitem(last=False)
+
+    def obtener(self, clave, max_antiguedad: float):
+        """(valor, antigüedad en segundos) o None si no hay o es más viejo que `max_antiguedad`."""
+        with self._lock:
+            guardado = self._valores.get(clave)
+        if guardado is None or time.time() - guardado[0] > max_antiguedad:
+            return None
+        return guardado[1], time.time() - guardado[0]
+
+
+def antiguedad_legible(segundos: float) -> str:
+    if segundos < 90:
+        return f"{segundos:.0f} segundos"
+    if segundos < 5400:
+        return f"{segundos / 60:.0f} minutos"
+    return f"{segundos / 3600:.1f} horas"
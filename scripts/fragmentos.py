@@ -0,0 +1,341 @@
+import os
+import bisect
+import asyncio
+import hashlib
+import importlib
+import threading
+import contextlib
+import multiprocessing
+from collections import deque
+
+# Reparto de conversaciones entre procesos worker con hashing consistente.
+# Todas las tareas de un thread_id caen en el mismo worker y ahí se ejecutan en orden, una a la vez:
+# el checkpointer nunca ve dos escritores concurrentes para un mismo thread.
+FRAGMENTOS_VNODOS = int(os.getenv("FRAGMENTOS_VNODOS", "128"))          # nodos virtuales por worker en el anillo
+FRAGMENTOS_DRENAJE_SEGUNDOS = float(os.getenv("FRAGMENTOS_DRENAJE_SEGUNDOS", "120"))
+FRAGMENTOS_CONSULTA_TIMEOUT = float(os.getenv("FRAGMENTOS_CONSULTA_TIMEOUT", "2"))      # espera de /metricas/* por worker
+
+
+def _hash(clave: str) -> int:
+    return int.from_bytes(hashlib.md5(clave.encode("utf-8")).digest()[:8], "big")
+
+
+class AnilloHash:
+    """Anillo de hashing consistente: al agregar o quitar un worker solo se mueven ~1/N de las claves."""
+
+    def __init__(self, vnodos: int = FRAGMENTOS_VNODOS):
+        self.vnodos = vnodos
+        self._puntos: list[int] = []
+        self._dueno: dict[int, str] = {}
+
+    def agregar(self, nodo: str):
+        for i in range(self.vnodos):
+            punto = _hash(f"{nodo}#{i}")
+            if punto in self._dueno:
+                continue
+            bisect.insort(self._puntos, punto)
+            self._dueno[punto] = nodo
+
+    def quitar(self, nodo: str):
+        self._puntos = [p for p in self._puntos if self._dueno[p] != nodo]
+        self._dueno = {p: n for p, n in self._dueno.items() if n != nodo}
+
+    def nodos(self) -> set[str]:
+        return set(self._dueno.values())
+
+    def nodo_para(self, clave: str) -> str:
+        if not self._puntos:
+            raise RuntimeError("El anillo no tiene workers")
+        i = bisect.bisect(self._puntos, _hash(clave)) % len(self._puntos)
+        return self._dueno[self._puntos[i]]
+
+
+class EjecutorOrdenado:
+    """
+    Ejecuta tareas async en orden por clave (una a la vez por conversación) y en paralelo entre claves.
+    Se usa dentro de cada worker y, sin workers, directamente en el proceso de FastAPI.
+    """
+
+    def __init__(self, manejador, al_terminar=None):
+        self.manejador = manejador
+        self.al_terminar = al_terminar
+        self._colas: dict[str, deque] = {}
+        self._drenajes: set[asyncio.Task] = set()
+
+    def enviar(self, clave: str, tarea: dict):
+        if clave in self._colas:
+            self._colas[clave].append(tarea)
+            return
+        self._colas[clave] = deque([tarea])
+        drenaje = asyncio.create_task(self._drenar(clave))
+        self._drenajes.add(drenaje)
+        drenaje.add_done_callback(self._drenajes.discard)
+
+    async def _drenar(self, clave: str):
+        cola = self._colas[clave]
+        try:
+            while cola:
+                tarea = cola[0]
+                try:
+                    await self.manejador(tarea)
+                except Exception as e:
+                    print(f"Error ejecutando tarea {tarea.get('tipo')} de {clave}: {e}")
+                finally:
+                    cola.popleft()
+                    if self.al_terminar:
+                        self.al_terminar(clave, tarea)
+        finally:
+            # Si cancelan el drenaje, la clave no puede quedar con una cola sin tarea que la consuma (enviar() le
+            # seguiría apilando tareas para siempre). Las descartadas se informan igual, para liberar el en-vuelo
+            # del despachador.
+            descartadas = self._colas.pop(clave, None) or deque()
+            if descartadas:
+                print(f"⚠️ Drenaje de {clave} cancelado: {len(descartadas)} tareas descartadas.")
+                for tarea in descartadas:
+                    if self.al_terminar:
+                        self.al_terminar(clave, tarea)
+
+    def pendientes(self) -> int:
+        return sum(len(c) for c in self._colas.values())
+
+    async def esperar(self):
+        while self._drenajes:
+            await asyncio.gather(*list(self._drenajes), return_exceptions=True)
+
+
+def _importar(ruta: str):
+    """'modulo:atributo' -> objeto. Los workers se crean con spawn: el manejador se resuelve por nombre."""
+    modulo, atributo = ruta.split(":")
+    return getattr(importlib.import_module(modulo), atributo)
+
+
+def _leer_en_hilo(cola, bucle: asyncio.AbstractEventLoop, nombre: str) -> asyncio.Queue:
+    """
+    Pasa los mensajes de una multiprocessing.Queue a una asyncio.Queue desde un hilo lector propio.
+    `await asyncio.to_thread(cola.get)` dejaría bloqueado para siempre un hilo del pool por defecto (el de los envíos
+    a Chatwoot y update_state), y loop.add_reader no sirve: el pipe de la Queue no marca dónde termina cada mensaje.
+    El hilo termina al leer None.
+    """
+    destino: asyncio.Queue = asyncio.Queue()
+
+    def leer():
+        while True:
+            mensaje = cola.get()
+            try:
+                bucle.call_soon_threadsafe(destino.put_nowait, mensaje)
+            except RuntimeError:
+                return  # el bucle ya cerró
+            if mensaje is None:
+                return
+
+    threading.Thread(target=leer, name=f"lector-{nombre}", daemon=True).start()
+    return destino
+
+
+def _consultar(ruta: str):
+    try:
+        return _importar(ruta)()
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _proceso_worker(nombre: str, entrada, salida, manejador: str, entorno: str | None):
+    asyncio.run(_bucle_worker(nombre, entrada, salida, manejador, entorno))
+
+
+async def _bucle_worker(nombre: str, entrada, salida, manejador: str, entorno: str | None):
+    funcion = _importar(manejador)
+    async with contextlib.AsyncExitStack() as pila:
+        if entorno:
+            # Warmup propio del worker (grafo, checkpointer, escritor de Zep). Las tareas esperan en la cola mientras tanto.
+            await pila.enter_async_context(_importar(entorno)())
+        salida.put(("listo", nombre, None, None))
+
+        ejecutor = EjecutorOrdenado(funcion, lambda clave, tarea: salida.put(("hecho", nombre, clave, tarea.get("id"))))
+        entrantes = _leer_en_hilo(entrada, asyncio.get_running_loop(), nombre)
+        while True:
+            mensaje = await entrantes.get()
+            if mensaje is None:
+                break
+            tipo, clave, tarea = mensaje
+            if tipo == "consulta":
+                # ("consulta", id, "modulo:funcion"): métricas de este proceso para el frente
+                salida.put(("consulta", nombre, clave, _consultar(tarea)))
+                continue
+            ejecutor.enviar(clave, tarea)
+        await ejecutor.esperar()
+
+
+class Despachador:
+    """
+    Frente de despacho: vive en el proceso de FastAPI y manda cada tarea al worker dueño de su clave.
+
+    Rebalanceo: una clave con tareas todavía en vuelo sigue yendo a su worker anterior hasta vaciarse
+    (asignación pegajosa), así el cambio de dueño nunca rompe el orden ni deja dos procesos escribiendo
+    el mismo checkpoint. Un worker que se quita deja de recibir claves nuevas y se apaga al drenar.
+    """
+
+    def __init__(self, cantidad: int, manejador: str, entorno: str | None = None, vnodos: int = FRAGMENTOS_VNODOS):
+        self.cantidad_inicial = cantidad
+        self.manejador = manejador
+        self.entorno = entorno
+        self.anillo = AnilloHash(vnodos)
+        self.workers: dict[str, dict] = {}
+        # clave -> [worker, tareas en vuelo]
+        self._en_vuelo: dict[str, list] = {}
+        self._ctx = multiprocessing.get_context("spawn")
+        self._salida = None
+        self._entrantes: asyncio.Queue | None = None
+        self._tareas: set[asyncio.Task] = set()
+        self._siguiente = 0
+        # id de consulta -> {worker: futuro con su respuesta}
+        self._consultas: dict[int, dict[str, asyncio.Future]] = {}
+        self._ultima_consulta = 0
+        self.al_completar = None  # callback opcional (clave, id_tarea), lo usa el benchmark
+
+    async def iniciar(self):
+        self._salida = self._ctx.Queue()
+        self._entrantes = _leer_en_hilo(self._salida, asyncio.get_running_loop(), "salida")
+        for _ in range(self.cantidad_inicial):
+            self._agregar_worker()
+        self._tareas = {asyncio.create_task(self._leer_salida()), asyncio.create_task(self._vigilar())}
+        print(f"🧩 Despachador con {self.cantidad_inicial} workers ({self.anillo.vnodos} nodos virtuales c/u)")
+
+    def _lanzar_proceso(self, nombre: str) -> dict:
+        cola = self._ctx.Queue()
+        proceso = self._ctx.Process(
+            target=_proceso_worker, args=(nombre, cola, self._salida, self.manejador, self.entorno),
+            name=f"worker-{nombre}", daemon=True,
+        )
+        proceso.start()
+        return {"proceso": proceso, "cola": cola, "listo": False, "drenando": False, "enviadas": 0, "completadas": 0}
+
+    def _agregar_worker(self) -> str:
+        nombre = f"w{self._siguiente}"
+        self._siguiente += 1
+        self.workers[nombre] = self._lanzar_proceso(nombre)
+        self.anillo.agregar(nombre)
+        return nombre
+
+    def enviar(self, clave: str, tarea: dict):
+        asignacion = self._en_vuelo.get(clave)
+        nombre = asignacion[0] if asignacion else self.anillo.nodo_para(clave)
+        worker = self.workers[nombre]
+        worker["cola"].put(("tarea", clave, tarea))
+        worker["enviadas"] += 1
+        if asignacion:
+            asignacion[1] += 1
+        else:
+            self._en_vuelo[clave] = [nombre, 1]
+
+    async def consultar(self, ruta: str, timeout: float = FRAGMENTOS_CONSULTA_TIMEOUT) -> dict:
+        """
+        Corre `ruta` ('modulo:funcion', sin argumentos) en cada worker listo y devuelve {worker: resultado}.
+        Lo usan los /metricas/*: el escritor de Zep, los cortacircuitos y el planificador viven en cada worker.
+        """
+        self._ultima_consulta += 1
+        id_consulta = self._ultima_consulta
+        bucle = asyncio.get_running_loop()
+        futuros = {
+            nombre: bucle.create_future()
+            for nombre, w in self.workers.items() if w["listo"] and w["proceso"].is_alive()
+        }
+        self._consultas[id_consulta] = futuros
+        try:
+            for nombre in futuros:
+                self.workers[nombre]["cola"].put(("consulta", id_consulta, ruta))
+            if futuros:
+                await asyncio.wait(futuros.values(), timeout=timeout)
+        finally:
+            del self._consultas[id_consulta]
+        return {nombre: f.result() if f.done() else {"error": f"sin respuesta en {timeout}s"} for nombre, f in futuros.items()}
+
+    async def _leer_salida(self):
+        while True:
+            mensaje = await self._entrantes.get()
+            if mensaje is None:
+                return
+            tipo, nombre, clave, id_tarea = mensaje
+            worker = self.workers.get(nombre)
+            if tipo == "consulta":
+                # ("consulta", worker, id de consulta, resultado)
+                futuro = self._consultas.get(clave, {}).get(nombre)
+                if futuro is not None and not futuro.done():
+                    futuro.set_result(id_tarea)
+            elif tipo == "listo":
+                if worker:
+                    worker["listo"] = True
+                print(f"✅ Worker {nombre} listo")
+            elif tipo == "hecho":
+                if worker:
+                    worker["completadas"] += 1
+                asignacion = self._en_vuelo.get(clave)
+                if asignacion and asignacion[0] == nombre:
+                    asignacion[1] -= 1
+                    if asignacion[1] <= 0:
+                        del self._en_vuelo[clave]
+                if self.al_completar:
+                    self.al_completar(clave, id_tarea)
+
+    async def _vigilar(self):
+        """Si un worker muere, se relanza con el mismo nombre (mismo tramo del anillo). Sus tareas en vuelo se pierden."""
+        while True:
+            await asyncio.sleep(5)
+            for nombre, worker in list(self.workers.items()):
+                if worker["proceso"].is_alive() or worker["drenando"]:
+                    continue
+                perdidas = [c for c, (n, _) in self._en_vuelo.items() if n == nombre]
+                for clave in perdidas:
+                    del self._en_vuelo[clave]
+                print(f"⚠️ Worker {nombre} murió (exit {worker['proceso'].exitcode}). Relanzando; {len(perdidas)} conversaciones con tareas perdidas.")
+                self.workers[nombre] = self._lanzar_proceso(nombre)
+
+    async def quitar_worker(self, nombre: str):
+        worker = self.workers[nombre]
+        worker["drenando"] = True
+        self.anillo.quitar(nombre)
+        limite = asyncio.get_running_loop().time() + FRAGMENTOS_DRENAJE_SEGUNDOS
+        while any(n == nombre for n, _ in self._en_vuelo.values()) and asyncio.get_running_loop().time() < limite:
+            await asyncio.sleep(0.05)
+        # Si venció el drenaje, las claves que sigan pegadas pasan a su nuevo dueño (única ventana sin garantía de orden)
+        for clave in [c for c, (n, _) in self._en_vuelo.items() if n == nombre]:
+            del self._en_vuelo[clave]
+        worker["cola"].put(None)
+        await asyncio.to_thread(worker["proceso"].join, 30)
+        if worker["proceso"].is_alive():
+            worker["proceso"].terminate()
+        del self.workers[nombre]
+        print(f"➖ Worker {nombre} retirado")
+
+    async def escalar(self, cantidad: int):
+        """Lleva la cantidad de workers activos a `cantidad`, agregando o drenando los más nuevos."""
+        activos = [n for n, w in self.workers.items() if not w["drenando"]]
+        while len(activos) < cantidad:
+            activos.append(self._agregar_worker())
+            print(f"➕ Worker {activos[-1]} agregado")
+        if len(activos) > cantidad:
+            sobrantes = sorted(activos, key=lambda n: int(n[1:]))[cantidad:]
+            await asyncio.gather(*(self.quitar_worker(n) for n in sobrantes))
+
+    def listo(self) -> bool:
+        activos = [w for w in self.workers.values() if not w["drenando"]]
+        return bool(activos) and all(w["listo"] for w in activos)
+
+    def estado(self) -> dict:
+        return {
+            "workers": {
+                nombre: {
+                    "pid": w["proceso"].pid, "vivo": w["proceso"].is_alive(), "listo": w["listo"], "drenando": w["drenando"],
+                    "enviadas": w["enviadas"], "completadas": w["completadas"],
+                }
+                for nombre, w in self.workers.items()
+            },
+            "conversaciones_en_vuelo": len(self._en_vuelo),
+        }
+
+    async def cerrar(self):
+        for nombre in list(self.workers):
+            await self.quitar_worker(nombre)
+        for tarea in self._tareas:
+            tarea.cancel()
+        self._salida.put(None)
@@ -0,0 +1,10 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+# Sesión HTTP única para todo el proceso (Chatwoot, Cal.com, Zep, imágenes).
+# Reutiliza conexiones keep-alive en lugar de abrir un socket nuevo por cada requests.post,
+# y es compartida por todos los tenants cuando el bot corre en modo multi-tenant.
+sesion_http = requests.Session()
+_adaptador = HTTPAdapter(pool_connections=20, pool_maxsize=50)
+sesion_http.mount("http://", _adaptador)
+sesion_http.mount("https://", _adaptador)
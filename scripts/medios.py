@@ -0,0 +1,189 @@
+import os
+import io
+import time
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from http_compartido import sesion_http
+import trazas
+
+# Presupuesto de las imágenes que mandamos a WhatsApp (vía Chatwoot).
+# WhatsApp acepta hasta 5 MB, pero además recomprime: mandar más de ~1 MB solo agrega latencia a la burbuja.
+MEDIA_MAX_LADO = int(os.getenv("MEDIA_MAX_LADO", "1600"))
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(800 * 1024)))
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "../.tmp/medios")
+# La caché se acota por tamaño total (se borran las variantes más viejas) y por edad (una foto reemplazada en la
+# misma URL se vuelve a bajar pasado ese plazo)
+MEDIA_CACHE_MAX_MB = float(os.getenv("MEDIA_CACHE_MAX_MB", "200"))
+MEDIA_CACHE_MAX_DIAS = float(os.getenv("MEDIA_CACHE_MAX_DIAS", "30"))
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+MEDIA_TIMEOUT = float(os.getenv("MEDIA_TIMEOUT", "30"))
+
+MIME_POR_FORMATO = {"jpeg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp", "heic": "image/heic"}
+EXTENSION_POR_FORMATO = {"jpeg": "jpg", "png": "png", "gif": "gif", "webp": "webp", "heic": "heic"}
+CALIDADES_JPEG = (85, 75, 65, 55, 45)
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_poda_lock = threading.Lock()
+
+
+def detectar_formato(datos: bytes) -> str | None:
+    """Formato real según los magic bytes (no confiamos en la extensión de la URL ni en el Content-Type)."""
+    if datos[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if datos[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if datos[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if datos[:4] == b"RIFF" and datos[8:12] == b"WEBP":
+        return "webp"
+    if datos[4:8] == b"ftyp" and datos[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "heic"
+    return None
+
+
+def _transcodificar(datos: bytes, max_lado: int, max_bytes: int) -> tuple[bytes, str]:
+    """
+    Corre en un proceso del pool: reduce y recomprime a JPEG hasta entrar en el presupuesto.
+    Devuelve (bytes, formato). Si el original ya es un JPEG dentro del presupuesto, se devuelve intacto.
+    """
+    from PIL import Image, ImageOps
+
+    imagen = Image.open(io.BytesIO(datos))
+    formato = detectar_formato(datos)
+    if formato == "jpeg" and len(datos) <= max_bytes and max(imagen.size) <= max_lado:
+        return datos, "jpeg"
+
+    # Primer cuadro (GIF/WebP animados), orientación EXIF aplicada y transparencias sobre fondo blanco
+    imagen.seek(0)
+    imagen = ImageOps.exif_transpose(imagen)
+    if imagen.mode in ("RGBA", "LA", "P"):
+        imagen = imagen.convert("RGBA")
+        fondo = Image.new("RGB", imagen.size, (255, 255, 255))
+        fondo.paste(imagen, mask=imagen.split()[-1])
+        imagen = fondo
+    elif imagen.mode != "RGB":
+        imagen = imagen.convert("RGB")
+
+    lado = max_lado
+    while True:
+        variante = imagen.copy()
+        variante.thumbnail((lado, lado), Image.LANCZOS)
+        for calidad in CALIDADES_JPEG:
+            salida = io.BytesIO()
+            variante.save(salida, format="JPEG", quality=calidad, optimize=True, progressive=True)
+            if salida.tell() <= max_bytes:
+                return salida.getvalue(), "jpeg"
+        if lado <= 320:
+            # Último recurso: la menor variante posible aunque exceda el presupuesto
+            return salida.getvalue(), "jpeg"
+        lado = int(lado * 0.75)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: el proceso de FastAPI tiene hilos vivos, y fork + hilos puede dejar locks tomados en el hijo
+                _pool = ProcessPoolExecutor(max_workers=MEDIA_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _ruta_cache(image_url: str) -> str:
+    clave = hashlib.sha1(f"{image_url}|{MEDIA_MAX_LADO}|{MEDIA_MAX_BYTES}".encode("utf-8")).hexdigest()
+    return os.path.join(MEDIA_CACHE_DIR, f"{clave}.jpg")
+
+
+def _vencida(ruta: str) -> bool:
+    return time.time() - os.path.getmtime(ruta) > MEDIA_CACHE_MAX_DIAS * 86400
+
+
+def _podar_cache():
+    """Borra las variantes vencidas y, si la caché sigue pasada de MEDIA_CACHE_MAX_MB, las más viejas hasta el 90 %."""
+    if not _poda_lock.acquire(blocking=False):
+        return  # ya hay una poda en curso en este proceso
+    try:
+        archivos = []
+        for entrada in os.scandir(MEDIA_CACHE_DIR):
+            try:
+                if entrada.is_file() and entrada.name.endswith(".jpg"):
+                    info = entrada.stat()
+                    archivos.append((info.st_mtime, info.st_size, entrada.path))
+            except FileNotFoundError:
+                continue
+        archivos.sort()
+        limite_edad = time.time() - MEDIA_CACHE_MAX_DIAS * 86400
+        total = sum(tamano for _, tamano, _ in archivos)
+        objetivo = MEDIA_CACHE_MAX_MB * 1024 * 1024
+        borrados = 0
+        for mtime, tamano, ruta in archivos:
+            if mtime >= limite_edad and total <= objetivo:
+                break
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass  # otro worker la podó primero
+            total -= tamano
+            borrados += 1
+            # Pasado el tope se baja hasta el 90 % para no podar en cada imagen nueva
+            objetivo = min(objetivo, MEDIA_CACHE_MAX_MB * 1024 * 1024 * 0.9)
+        if borrados:
+            print(f"🧹 Caché de imágenes: {borrados} variantes borradas ({total // 1024} KB en uso)")
+    finally:
+        _poda_lock.release()
+
+
+@trazas.trazar("medios.obtener_imagen")
+def obtener_imagen_whatsapp(image_url: str) -> dict | None:
+    """
+    Devuelve {"datos", "mime", "nombre"} listo para adjuntar en Chatwoot, o None si la imagen no se pudo descargar.
+    Las variantes generadas se guardan en MEDIA_CACHE_DIR: la misma foto de una propiedad no se vuelve a bajar ni a codificar.
+    Bloquea el hilo que la llama (nunca llamarla desde el event loop): la codificación corre en el pool de procesos.
+    """
+    ruta = _ruta_cache(image_url)
+    try:
+        if not _vencida(ruta):
+            with open(ruta, "rb") as f:
+                return {"datos": f.read(), "mime": "image/jpeg", "nombre": "propiedad.jpg"}
+    except FileNotFoundError:
+        pass  # no estaba en caché (o la podaron entre medio)
+
+    img_r = sesion_http.get(image_url, timeout=10)
+    if img_r.status_code != 200:
+        return None
+
+    original = img_r.content
+    formato = detectar_formato(original)
+    try:
+        datos, formato_final = _get_pool().submit(_transcodificar, original, MEDIA_MAX_LADO, MEDIA_MAX_BYTES).result(timeout=MEDIA_TIMEOUT)
+    except Exception as e:
+        # Formato que Pillow no decodifica (ej. HEIC sin plugin): mandamos el original con su tipo real
+        print(f"⚠️ No se pudo transcodificar la imagen ({formato or 'desconocido'}, {len(original)} bytes): {e}")
+        if formato is None:
+            return None
+        return {"datos": original, "mime": MIME_POR_FORMATO[formato], "nombre": f"propiedad.{EXTENSION_POR_FORMATO[formato]}"}
+
+    try:
+        os.makedirs(MEDIA_CACHE_DIR, exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(datos)
+        os.replace(temporal, ruta)
+        _podar_cache()
+    except Exception as e:
+        print(f"Error guardando variante de imagen en caché: {e}")
+
+    print(f"🖼️ Imagen {formato or '?'} {len(original) // 1024} KB -> {formato_final} {len(datos) // 1024} KB")
+    return {"datos": datos, "mime": MIME_POR_FORMATO[formato_final], "nombre": f"propiedad.{EXTENSION_POR_FORMATO[formato_final]}"}
+
+
+def cerrar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
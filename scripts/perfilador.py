@@ -0,0 +1,183 @@
+import os
+import sys
+import json
+import time
+import random
+import pstats
+import cProfile
+import threading
+
+# Perfilado bajo demanda de turnos completos (get_state + invoke del grafo) con cProfile.
+# Se activa por conversación (PROFILE_CONVERSACIONES o el endpoint /admin/perfilar) o por muestreo (PROFILE_SAMPLE_RATE).
+# Apagado, el único costo por turno es leer un booleano en debe_perfilar().
+PROFILE_DIR = os.getenv("PROFILE_DIR", "../.tmp/perfiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "25"))
+
+# Categorías para separar dónde se fue el tiempo del turno (primer patrón que matchea en la ruta del archivo)
+CATEGORIAS = [
+    ("checkpoint", ("langgraph/checkpoint", "psycopg", "psycopg_pool", "msgpack", "ormsgpack", "zstandard")),
+    ("llm_sdk", ("langchain_openai", "openai/", "tiktoken")),
+    ("tools", ("scripts/tools.py", "langgraph/prebuilt", "googleapiclient", "catalogo.py")),
+    ("red", ("ssl.py", "socket.py", "http/client.py", "urllib3", "requests/", "httpx", "httpcore", "anyio", "httplib2")),
+    ("prompt_y_nodos", ("scripts/main.py", "plazos.py", "tenants.py")),
+    ("langgraph", ("langgraph/", "langchain_core")),
+]
+
+# thread_id -> turnos restantes a perfilar
+_marcadas: dict[str, int] = {}
+_marcadas_lock = threading.Lock()
+_activo = False
+# Desde Python 3.12 cProfile usa sys.monitoring: un solo perfilador a la vez en todo el proceso
+_captura_lock = threading.Lock()
+
+
+def _recalcular_activo():
+    global _activo
+    _activo = bool(_marcadas) or PROFILE_SAMPLE_RATE > 0
+
+
+def marcar(thread_id: str, turnos: int = 1):
+    """Perfila los próximos `turnos` turnos de la conversación."""
+    with _marcadas_lock:
+        _marcadas[thread_id] = turnos
+        _recalcular_activo()
+
+
+def desmarcar(thread_id: str):
+    with _marcadas_lock:
+        _marcadas.pop(thread_id, None)
+        _recalcular_activo()
+
+
+def marcadas() -> dict[str, int]:
+    with _marcadas_lock:
+        return dict(_marcadas)
+
+
+for _thread_id in filter(None, (t.strip() for t in os.getenv("PROFILE_CONVERSACIONES", "").split(","))):
+    # Por env: se perfilan todos los turnos de esas conversaciones mientras el proceso viva
+    marcar(_thread_id, turnos=-1)
+_recalcular_activo()
+
+
+def debe_perfilar(thread_id: str) -> bool:
+    if not _activo:
+        return False
+    with _marcadas_lock:
+        restantes = _marcadas.get(thread_id)
+        if restantes is not None:
+            if restantes > 0:
+                if restantes == 1:
+                    del _marcadas[thread_id]
+                    _recalcular_activo()
+                else:
+                    _marcadas[thread_id] = restantes - 1
+            return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _categoria(archivo: str) -> str:
+    archivo = archivo.replace("\\", "/")
+    for nombre, patrones in CATEGORIAS:
+        if any(p in archivo for p in patrones):
+            return nombre
+    return "otros"
+
+
+def _resumen(stats: pstats.Stats) -> dict:
+    """Tiempo propio (tottime) sumado por categoría y las funciones con más tiempo acumulado."""
+    por_categoria: dict[str, float] = {}
+    funciones = []
+    for (archivo, linea, funcion), (_, llamadas, tottime, cumtime, _) in stats.stats.items():
+        categoria = _categoria(archivo)
+        por_categoria[categoria] = por_categoria.get(categoria, 0.0) + tottime
+        funciones.append((cumtime, tottime, llamadas, f"{archivo}:{linea}({funcion})"))
+    funciones.sort(reverse=True)
+    return {
+        "por_categoria_segundos": {k: round(v, 4) for k, v in sorted(por_categoria.items(), key=lambda kv: -kv[1])},
+        "top_acumulado": [
+            {"funcion": f, "acumulado": round(c, 4), "propio": round(t, 4), "llamadas": n}
+            for c, t, n, f in funciones[:PROFILE_TOP]
+        ],
+    }
+
+
+def perfilar(thread_id: str, funcion, *args, **kwargs):
+    """
+    Ejecuta funcion(*args, **kwargs) bajo cProfile en el hilo actual y guarda en PROFILE_DIR:
+      - {thread_id}_{ts}.prof: volcado de pstats (snakeviz / python -m pstats)
+      - {thread_id}_{ts}.json: thread id, tiempos de pared y CPU, y resumen por categoría
+    Si ya hay otro turno perfilándose, este corre sin perfilar (el perfilador es global al proceso).
+    """
+    if not _captura_lock.acquire(blocking=False):
+        print(f"⚠️ Perfilador ocupado: el turno de {thread_id} corre sin perfilar.")
+        return funcion(*args, **kwargs)
+
+    perfil = cProfile.Profile()
+    inicio_ts = time.time()
+    inicio = time.perf_counter()
+    inicio_cpu = time.thread_time()
+    error = None
+    try:
+        perfil.enable()
+        try:
+            return funcion(*args, **kwargs)
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            perfil.disable()
+    finally:
+        _captura_lock.release()
+        try:
+            _guardar(perfil, thread_id, inicio_ts, time.perf_counter() - inicio, time.thread_time() - inicio_cpu, error)
+        except Exception as e:
+            print(f"Error guardando perfil del turno {thread_id}: {e}")
+
+
+def _guardar(perfil: cProfile.Profile, thread_id: str, inicio_ts: float, pared: float, cpu: float, error: str | None):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    seguro = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(thread_id))
+    base = os.path.join(PROFILE_DIR, f"{seguro}_{int(inicio_ts * 1000)}")
+    perfil.dump_stats(f"{base}.prof")
+
+    stats = pstats.Stats(perfil)
+    datos = {
+        "thread_id": thread_id,
+        "inicio": inicio_ts,
+        "pared_segundos": round(pared, 4),
+        "cpu_segundos": round(cpu, 4),
+        # El resto de la pared es espera: red, locks, sleeps
+        "espera_segundos": round(max(pared - cpu, 0.0), 4),
+        "error": error,
+        "python": sys.version.split()[0],
+        # En 3.12+ el perfil incluye lo que corrieron otros hilos en paralelo (sys.monitoring es global)
+        "captura_global": sys.version_info >= (3, 12),
+        **_resumen(stats),
+    }
+    with open(f"{base}.json", "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, indent=2)
+    print(f"🔬 Perfil del turno {thread_id}: {pared:.2f}s pared / {cpu:.2f}s CPU -> {base}.prof")
+
+
+def listar_perfiles(limite: int = 50) -> list[dict]:
+    """Resúmenes (sidecar .json) de los perfiles más recientes."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    archivos = sorted((a for a in os.listdir(PROFILE_DIR) if a.endswith(".json")), key=lambda a: a.rsplit("_", 1)[-1], reverse=True)
+    resumenes = []
+    for archivo in archivos[:limite]:
+        try:
+            with open(os.path.join(PROFILE_DIR, archivo), encoding="utf-8") as f:
+                datos = json.load(f)
+            resumenes.append({
+                "archivo": archivo.removesuffix(".json") + ".prof",
+                "thread_id": datos.get("thread_id"),
+                "pared_segundos": datos.get("pared_segundos"),
+                "cpu_segundos": datos.get("cpu_segundos"),
+                "por_categoria_segundos": datos.get("por_categoria_segundos"),
+            })
+        except Exception:
+            continue
+    return resumenes
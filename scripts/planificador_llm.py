@@ -0,0 +1,418 @@
+import os
+import re
+import time
+import asyncio
+import threading
+import functools
+import contextvars
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import trazas
+
+# Planificador global de llamadas al LLM: todas las conversaciones comparten los límites de la cuenta de OpenAI
+# (tokens y solicitudes por minuto). En vez de salir todas a la vez y comerse una tormenta de 429, cada llamada
+# pide permiso: se admite si entra en el presupuesto y, si no, espera en una cola ordenada por prioridad comercial
+# (un lead en Lista_Cierre pasa antes que una charla Nueva). La concurrencia se adapta (AIMD) a los 429.
+PLANIFICADOR_LLM = os.getenv("PLANIFICADOR_LLM", "1") == "1"
+# Límites de la cuenta hasta leer los headers x-ratelimit-* de la primera respuesta
+PLANIFICADOR_TPM = int(os.getenv("PLANIFICADOR_TPM", "200000"))
+PLANIFICADOR_RPM = int(os.getenv("PLANIFICADOR_RPM", "500"))
+PLANIFICADOR_OBJETIVO = float(os.getenv("PLANIFICADOR_OBJETIVO", "0.9"))           # fracción del límite que se usa
+PLANIFICADOR_CONCURRENCIA_INICIAL = float(os.getenv("PLANIFICADOR_CONCURRENCIA_INICIAL", "8"))
+PLANIFICADOR_CONCURRENCIA_MAXIMA = float(os.getenv("PLANIFICADOR_CONCURRENCIA_MAXIMA", "32"))
+PLANIFICADOR_SALIDA_ESTIMADA = int(os.getenv("PLANIFICADOR_SALIDA_ESTIMADA", "400"))      # tokens de salida reservados
+PLANIFICADOR_TOKENS_HERRAMIENTAS = int(os.getenv("PLANIFICADOR_TOKENS_HERRAMIENTAS", "1000"))  # schemas de las tools
+PLANIFICADOR_ESPERA_MAXIMA = float(os.getenv("PLANIFICADOR_ESPERA_MAXIMA", "30"))        # sin deadline de turno
+PLANIFICADOR_ENVEJECIMIENTO = float(os.getenv("PLANIFICADOR_ENVEJECIMIENTO", "10"))     # segundos en cola = 1 nivel
+PLANIFICADOR_HITL_VENTANA = float(os.getenv("PLANIFICADOR_HITL_VENTANA", "1800"))
+# Hilos propios para correr los turnos del grafo: más que la concurrencia máxima, para que un turno en la cola
+# del LLM no deje sin hilo a uno más urgente (los que no entran esperan en el event loop, también por prioridad)
+PLANIFICADOR_HILOS_TURNOS = int(os.getenv("PLANIFICADOR_HILOS_TURNOS", "48"))
+
+# Menor = más urgente. Un lead listo para cerrar no puede esperar detrás de una consulta exploratoria.
+PRIORIDAD_FASE = {"Lista_Cierre": 0, "Agendada": 1, "Calificando": 2, "Nueva": 3}
+# Ningún nodo escribe todavía fase_venta: mientras diga "Nueva" se infiere de las tools que ya usó la conversación
+FASE_POR_HERRAMIENTA = {
+    "agendar_cita_calcom": "Agendada",
+    "obtener_slots_disponibles": "Lista_Cierre",
+    "obtener_link_agenda": "Lista_Cierre",
+    "registrar_lead": "Lista_Cierre",
+    "consultar_propiedades": "Calificando",
+}
+# Una conversación que un humano devolvió hace poco al bot suma hasta este adelanto (decrece con los minutos)
+ADELANTO_HITL = 2.0
+VENTANA_SEGUNDOS = 60.0
+
+
+class SinCupoLLM(Exception):
+    """La llamada no consiguió presupuesto del LLM antes de que se le acabe el tiempo al turno."""
+
+
+def _segundos(duracion: str | None) -> float | None:
+    """Duraciones de los headers de OpenAI: "1s", "6m0s", "120ms", "1h2m3.5s"."""
+    if not duracion:
+        return None
+    total = 0.0
+    for valor, unidad in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", duracion):
+        total += float(valor) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unidad]
+    return total
+
+
+_hitl: dict[str, float] = {}
+# Última prioridad por fase de cada conversación: ordena sus turnos antes de que el hilo lea el checkpoint
+_fases: OrderedDict[str, float] = OrderedDict()
+_FASES_MAXIMAS = 10000
+
+
+def marcar_hitl(thread_id: str):
+    """Un humano tomó o devolvió la conversación: sus próximos turnos pasan adelante en la cola."""
+    _hitl[thread_id] = time.time()
+
+
+def fase_efectiva(state: dict) -> str:
+    fase = state.get("fase_venta") or "Nueva"
+    if fase != "Nueva":
+        return fase
+    for mensaje in reversed(state.get("historial_mensajes", [])):
+        for llamada in getattr(mensaje, "tool_calls", None) or []:
+            if llamada.get("name") in FASE_POR_HERRAMIENTA:
+                inferida = FASE_POR_HERRAMIENTA[llamada["name"]]
+                if PRIORIDAD_FASE[inferida] < PRIORIDAD_FASE[fase]:
+                    fase = inferida
+    return fase
+
+
+def _adelanto_hitl(thread_id: str) -> float:
+    marcado = _hitl.get(thread_id)
+    if marcado is None:
+        return 0.0
+    edad = time.time() - marcado
+    if edad < PLANIFICADOR_HITL_VENTANA:
+        return ADELANTO_HITL * (1 - edad / PLANIFICADOR_HITL_VENTANA)
+    _hitl.pop(thread_id, None)
+    return 0.0
+
+
+def prioridad_para(state: dict, thread_id: str) -> float:
+    prioridad = float(PRIORIDAD_FASE.get(fase_efectiva(state), PRIORIDAD_FASE["Nueva"]))
+    _fases[thread_id] = prioridad
+    _fases.move_to_end(thread_id)
+    while len(_fases) > _FASES_MAXIMAS:
+        _fases.popitem(last=False)
+    return prioridad - _adelanto_hitl(thread_id)
+
+
+def prioridad_conocida(thread_id: str) -> float:
+    """Prioridad sin leer el estado: la fase vista en el último turno de la conversación (Nueva si no hubo)."""
+    return _fases.get(thread_id, float(PRIORIDAD_FASE["Nueva"])) - _adelanto_hitl(thread_id)
+
+
+def estimar_tokens(mensajes: list) -> int:
+    """Reserva por llamada: ~4 caracteres por token de entrada + schemas de tools + la salida esperada."""
+    caracteres = sum(len(str(getattr(m, "content", m))) for m in mensajes)
+    return caracteres // 4 + PLANIFICADOR_TOKENS_HERRAMIENTAS + PLANIFICADOR_SALIDA_ESTIMADA
+
+
+class Permiso:
+    """Una llamada admitida. `registrar` ajusta la reserva con el uso real; `extra` pide cupo para una cobertura."""
+
+    def __init__(self, planificador: "Planificador", entrada: list):
+        self.planificador = planificador
+        self.entrada = entrada          # [instante, tokens] dentro de la ventana del planificador
+        self.extras: list[list] = []
+
+    def extra(self) -> bool:
+        return self.planificador._admitir_extra(self)
+
+    def registrar(self, respuesta):
+        self.planificador._registrar_respuesta(self, respuesta)
+
+
+class Planificador:
+    def __init__(self, tpm: int = PLANIFICADOR_TPM, rpm: int = PLANIFICADOR_RPM,
+                 concurrencia: float = PLANIFICADOR_CONCURRENCIA_INICIAL):
+        self.limite_tokens = tpm
+        self.limite_solicitudes = rpm
+        self.concurrencia = concurrencia
+        self._cond = threading.Condition()
+        self._cola: list[dict] = []
+        self._secuencia = 0
+        self._en_vuelo = 0
+        # [instante, tokens] de cada solicitud admitida en el último minuto (la reserva se corrige con el uso real)
+        self._ventana: deque[list] = deque()
+        # Foto de x-ratelimit-remaining-*: la única señal de lo que gastan los demás procesos con la misma cuenta
+        self._remanente: dict | None = None
+        self._pausa_hasta = 0.0
+        self.metricas = {"admitidas": 0, "extras": 0, "encoladas": 0, "vencidas": 0, "errores_429": 0,
+                         "espera_total": 0.0, "espera_maxima": 0.0}
+
+    # --- Presupuesto ---
+
+    def _podar(self, ahora: float):
+        while self._ventana and ahora - self._ventana[0][0] > VENTANA_SEGUNDOS:
+            self._ventana.popleft()
+
+    def _hay_presupuesto(self, tokens: int, extra: bool = False) -> bool:
+        """Se llama con el lock tomado."""
+        ahora = time.time()
+        if ahora < self._pausa_hasta:
+            return False
+        # Las coberturas no ocupan lugar de concurrencia propio: viven y mueren con su llamada principal
+        if not extra and self._en_vuelo >= max(1, int(self.concurrencia)):
+            return False
+        self._podar(ahora)
+        if len(self._ventana) + 1 > PLANIFICADOR_OBJETIVO * self.limite_solicitudes:
+            return False
+        usados = sum(t for _, t in self._ventana)
+        # Una llamada más grande que todo el presupuesto igual sale cuando la ventana está vacía
+        if self._ventana and usados + tokens > PLANIFICADOR_OBJETIVO * self.limite_tokens:
+            return False
+        remanente = self._remanente
+        # La foto solo se renueva con una respuesta: sin nada en vuelo se deja pasar una llamada para no esperar
+        # hasta que venza (o el 429 que devuelva pausa con el retry-after real)
+        if remanente is not None and ahora < remanente["vence"] and self._en_vuelo:
+            despues = [t for instante, t in self._ventana if instante >= remanente["instante"]]
+            if remanente["tokens"] is not None and remanente["tokens"] - sum(despues) < tokens:
+                return False
+            if remanente["solicitudes"] is not None and remanente["solicitudes"] - len(despues) < 1:
+                return False
+        return True
+
+    def _siguiente(self, ahora: float) -> dict | None:
+        """La más urgente de la cola. Cada PLANIFICADOR_ENVEJECIMIENTO segundos de espera suben un nivel (sin inanición)."""
+        if not self._cola:
+            return None
+        return min(self._cola, key=lambda s: (s["prioridad"] - (ahora - s["llegada"]) / PLANIFICADOR_ENVEJECIMIENTO, s["secuencia"]))
+
+    def _admitir(self, tokens: int) -> list:
+        entrada = [time.time(), tokens]
+        self._ventana.append(entrada)
+        self._en_vuelo += 1
+        self.metricas["admitidas"] += 1
+        return entrada
+
+    def adquirir(self, prioridad: float, tokens: int, espera_maxima: float | None) -> Permiso:
+        inicio = time.time()
+        with self._cond:
+            self._secuencia += 1
+            solicitud = {"prioridad": prioridad, "llegada": inicio, "secuencia": self._secuencia}
+            self._cola.append(solicitud)
+            encolada = False
+            try:
+                while True:
+                    ahora = time.time()
+                    if self._siguiente(ahora) is solicitud and self._hay_presupuesto(tokens):
+                        self._cola.remove(solicitud)
+                        espera = ahora - inicio
+                        self.metricas["espera_total"] += espera
+                        self.metricas["espera_maxima"] = max(self.metricas["espera_maxima"], espera)
+                        # La que sigue en la cola puede tener presupuesto también
+                        self._cond.notify_all()
+                        return Permiso(self, self._admitir(tokens))
+                    if not encolada:
+                        encolada = True
+                        self.metricas["encoladas"] += 1
+                    restante = None if espera_maxima is None else espera_maxima - (ahora - inicio)
+                    if restante is not None and restante <= 0:
+                        self._cola.remove(solicitud)
+                        self.metricas["vencidas"] += 1
+                        self._cond.notify_all()
+                        raise SinCupoLLM(f"sin cupo en el LLM tras {ahora - inicio:.1f}s en cola")
+                    # Los cupos de la ventana se liberan solos con el tiempo: se reevalúa al menos cada medio segundo
+                    self._cond.wait(0.5 if restante is None else min(0.5, restante))
+            except BaseException:
+                if solicitud in self._cola:
+                    self._cola.remove(solicitud)
+                    self._cond.notify_all()
+                raise
+
+    def _admitir_extra(self, permiso: Permiso) -> bool:
+        with self._cond:
+            # Una cobertura nunca pasa por delante de un lead esperando en la cola
+            if self._cola or not self._hay_presupuesto(permiso.entrada[1], extra=True):
+                return False
+            entrada = [time.time(), permiso.entrada[1]]
+            self._ventana.append(entrada)
+            permiso.extras.append(entrada)
+            self.metricas["extras"] += 1
+            return True
+
+    # --- Retroalimentación ---
+
+    def _leer_headers(self, headers: dict):
+        """Se llama con el lock tomado."""
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        if "x-ratelimit-limit-tokens" in headers:
+            self.limite_tokens = int(headers["x-ratelimit-limit-tokens"])
+        if "x-ratelimit-limit-requests" in headers:
+            self.limite_solicitudes = int(headers["x-ratelimit-limit-requests"])
+        tokens = headers.get("x-ratelimit-remaining-tokens")
+        solicitudes = headers.get("x-ratelimit-remaining-requests")
+        if tokens is None and solicitudes is None:
+            return
+        ahora = time.time()
+        reinicio = max(_segundos(headers.get("x-ratelimit-reset-tokens")) or 0, _segundos(headers.get("x-ratelimit-reset-requests")) or 0)
+        self._remanente = {
+            "instante": ahora,
+            "tokens": int(tokens) if tokens is not None else None,
+            "solicitudes": int(solicitudes) if solicitudes is not None else None,
+            "vence": ahora + min(reinicio or VENTANA_SEGUNDOS, VENTANA_SEGUNDOS),
+        }
+        # Cerca del borde de la cuenta (otros procesos también gastan): se frena antes de que lleguen los 429
+        if tokens is not None and int(tokens) < (1 - PLANIFICADOR_OBJETIVO) * self.limite_tokens:
+            self.concurrencia = max(1.0, self.concurrencia * 0.75)
+
+    def _registrar_respuesta(self, permiso: Permiso, respuesta):
+        metadata = getattr(respuesta, "response_metadata", None)
+        # Los headers no se guardan en el checkpoint: se leen y se sacan del mensaje
+        headers = metadata.pop("headers", None) if isinstance(metadata, dict) else None
+        uso = getattr(respuesta, "usage_metadata", None) or {}
+        with self._cond:
+            if uso.get("total_tokens"):
+                permiso.entrada[1] = uso["total_tokens"]
+            if headers:
+                self._leer_headers(headers)
+            # Aumento aditivo: +1 de concurrencia por cada "concurrencia" llamadas buenas
+            self.concurrencia = min(PLANIFICADOR_CONCURRENCIA_MAXIMA, self.concurrencia + 1 / max(1.0, self.concurrencia))
+
+    def liberar(self, permiso: Permiso, error: BaseException | None = None):
+        with self._cond:
+            self._en_vuelo -= 1
+            if error is not None and (type(error).__name__ == "RateLimitError" or getattr(error, "status_code", None) == 429):
+                # Disminución multiplicativa y pausa hasta que OpenAI diga (retry-after o reinicio de la ventana)
+                self.metricas["errores_429"] += 1
+                self.concurrencia = max(1.0, self.concurrencia / 2)
+                headers = dict(getattr(getattr(error, "response", None), "headers", None) or {})
+                self._leer_headers(headers)
+                pausa = _segundos(headers.get("retry-after") and f"{headers['retry-after']}s") or \
+                    _segundos(headers.get("x-ratelimit-reset-tokens")) or 1.0
+                self._pausa_hasta = max(self._pausa_hasta, time.time() + min(pausa, VENTANA_SEGUNDOS))
+                print(f"🚦 429 de OpenAI: concurrencia del LLM baja a {self.concurrencia:.1f}, pausa de {pausa:.1f}s.")
+            self._cond.notify_all()
+
+    def estado(self) -> dict:
+        with self._cond:
+            ahora = time.time()
+            self._podar(ahora)
+            admitidas = max(1, self.metricas["admitidas"])
+            return {
+                "activo": PLANIFICADOR_LLM,
+                "concurrencia": round(self.concurrencia, 2),
+                "en_vuelo": self._en_vuelo,
+                "en_cola": len(self._cola),
+                "tokens_ultimo_minuto": sum(t for _, t in self._ventana),
+                "solicitudes_ultimo_minuto": len(self._ventana),
+                "limite_tokens": self.limite_tokens,
+                "limite_solicitudes": self.limite_solicitudes,
+                "remanente_openai": dict(self._remanente) if self._remanente else None,
+                "pausado_por": round(max(0.0, self._pausa_hasta - ahora), 1),
+                "turnos": {"hilos": _asientos.total, "hilos_libres": _asientos.libres, "en_espera": _asientos.en_espera()},
+                **{k: v for k, v in self.metricas.items() if k != "espera_total"},
+                "espera_promedio": round(self.metricas["espera_total"] / admitidas, 3),
+            }
+
+
+planificador = Planificador()
+
+
+class _PermisoLibre:
+    """Con PLANIFICADOR_LLM=0: no reserva nada y no limita las coberturas."""
+
+    def extra(self) -> bool:
+        return True
+
+    def registrar(self, respuesta):
+        # Por si el cliente igual pidió los headers: nunca llegan al checkpoint
+        metadata = getattr(respuesta, "response_metadata", None)
+        if isinstance(metadata, dict):
+            metadata.pop("headers", None)
+
+
+@contextmanager
+def permiso(prioridad: float, tokens: int, espera_maxima: float | None = PLANIFICADOR_ESPERA_MAXIMA):
+    """Bloque de una llamada al LLM: espera cupo (o levanta SinCupoLLM) y libera al salir, avisando si fue un 429."""
+    if not PLANIFICADOR_LLM:
+        yield _PermisoLibre()
+        return
+    inicio = time.time()
+    otorgado = planificador.adquirir(prioridad, tokens, espera_maxima)
+    trazas.anotar(llm_prioridad=round(prioridad, 2), llm_espera_cola=round(time.time() - inicio, 3))
+    try:
+        yield otorgado
+    except BaseException as e:
+        planificador.liberar(otorgado, e)
+        raise
+    planificador.liberar(otorgado)
+
+
+class _Asientos:
+    """
+    Cupo de hilos de turno, administrado en el event loop. Un turno que no consigue hilo espera acá sin ocupar
+    ninguno y sale por prioridad (con el mismo envejecimiento que la cola del LLM). Solo se usa desde el loop.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.libres = total
+        self._espera: list[dict] = []
+        self._secuencia = 0
+
+    def en_espera(self) -> int:
+        return sum(1 for s in self._espera if not s["futuro"].done())
+
+    async def tomar(self, prioridad: float):
+        if self.libres > 0 and not self.en_espera():
+            self.libres -= 1
+            return
+        self._secuencia += 1
+        solicitud = {"prioridad": prioridad, "llegada": time.time(), "secuencia": self._secuencia,
+                     "futuro": asyncio.get_running_loop().create_future()}
+        self._espera.append(solicitud)
+        try:
+            await solicitud["futuro"]
+        except asyncio.CancelledError:
+            # Cancelado justo después de recibir el hilo: se lo pasa al siguiente
+            if solicitud["futuro"].done() and not solicitud["futuro"].cancelled():
+                self.soltar()
+            raise
+
+    def soltar(self):
+        ahora = time.time()
+        self._espera = [s for s in self._espera if not s["futuro"].done()]
+        if not self._espera:
+            self.libres += 1
+            return
+        siguiente = min(self._espera, key=lambda s: (s["prioridad"] - (ahora - s["llegada"]) / PLANIFICADOR_ENVEJECIMIENTO, s["secuencia"]))
+        self._espera.remove(siguiente)
+        siguiente["futuro"].set_result(None)
+
+
+_hilos_turnos = ThreadPoolExecutor(max_workers=PLANIFICADOR_HILOS_TURNOS, thread_name_prefix="turno")
+_asientos = _Asientos(PLANIFICADOR_HILOS_TURNOS)
+
+
+async def correr_turno(thread_id: str, funcion, *args):
+    """
+    Reemplazo de asyncio.to_thread para el turno del grafo. El pool por defecto tiene min(32, cpu+4) hilos: con
+    turnos Nueva bloqueados en la cola del LLM, uno en Lista_Cierre quedaría en la FIFO del executor sin llegar
+    nunca a la cola por prioridad. Acá espera en el loop ordenado por prioridad y corre en un pool propio.
+    """
+    await _asientos.tomar(prioridad_conocida(thread_id))
+    bucle = asyncio.get_running_loop()
+    contexto = contextvars.copy_context()
+    try:
+        futuro = _hilos_turnos.submit(functools.partial(contexto.run, funcion, *args))
+    except BaseException:
+        _asientos.soltar()
+        raise
+    # El hilo se devuelve cuando el turno termina de verdad (aunque quien espera se haya cancelado)
+    def devolver(_):
+        try:
+            bucle.call_soon_threadsafe(_asientos.soltar)
+        except RuntimeError:
+            pass  # el loop ya cerró (apagado)
+
+    futuro.add_done_callback(devolver)
+    return await asyncio.wrap_future(futuro)
@@ -0,0 +1,44 @@
+import os
+import time
+
+# Presupuesto total de un turno del lead: desde que entra el mensaje hasta que el grafo termina.
+# Se fija una vez en procesar_langgraph y viaja en config["configurable"]["deadline_turno"] a cada nodo,
+# tool y llamada saliente, que recortan su propio timeout a lo que quede.
+TURNO_TIMEOUT_SEGUNDOS = float(os.getenv("TURNO_TIMEOUT_SEGUNDOS", "45"))
+# Máximo de rondas agent -> tools_node por turno
+MAX_ITERACIONES_HERRAMIENTAS = int(os.getenv("MAX_ITERACIONES_HERRAMIENTAS", "4"))
+# Por debajo de esto no vale la pena arrancar otra llamada al LLM
+MINIMO_PARA_LLM = float(os.getenv("MINIMO_PARA_LLM_SEGUNDOS", "3"))
+
+MENSAJE_ESPERA = "Dame un momento que estoy verificando esa información y enseguida te confirmo."
+
+
+def nuevo_deadline() -> float:
+    """Epoch (time.time) en que vence el turno. Epoch y no monotonic: el config puede viajar a otro proceso."""
+    return time.time() + TURNO_TIMEOUT_SEGUNDOS
+
+
+def deadline_de(config) -> float | None:
+    if not config:
+        return None
+    return (config.get("configurable") or {}).get("deadline_turno")
+
+
+def tiempo_restante(config, maximo: float | None = None, minimo: float = 0.0) -> float | None:
+    """
+    Timeout a usar en una llamada: lo que le queda al turno, recortado a `maximo` (el timeout propio de la integración)
+    y con piso `minimo` (para llamadas que deben salir igual, como apagar el bot en un HITL).
+    Sin deadline en el config devuelve `maximo` (comportamiento previo).
+    """
+    deadline = deadline_de(config)
+    if deadline is None:
+        return maximo
+    restante = deadline - time.time()
+    if maximo is not None:
+        restante = min(restante, maximo)
+    return max(restante, minimo)
+
+
+def agotado(config, margen: float = 0.0) -> bool:
+    deadline = deadline_de(config)
+    return deadline is not None and time.time() + margen >= deadline
@@ -0,0 +1,28 @@
+import time
+import threading
+
+# Estado de cada dependencia pesada del bot, reportado por GET /ready.
+# Módulo liviano a propósito: se puede consultar sin importar LangGraph ni las SDKs de Google.
+#   estado: "pendiente" | "ok" | "degradado" | "error"
+ESTADO_DEPENDENCIAS: dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def registrar(nombre: str, estado: str, detalle: str = "", segundos: float | None = None):
+    with _lock:
+        ESTADO_DEPENDENCIAS[nombre] = {
+            "estado": estado,
+            "detalle": detalle,
+            "segundos": round(segundos, 3) if segundos is not None else None,
+            "actualizado": time.time(),
+        }
+
+
+def estado(nombre: str) -> str:
+    with _lock:
+        return ESTADO_DEPENDENCIAS.get(nombre, {}).get("estado", "pendiente")
+
+
+def resumen() -> dict[str, dict]:
+    with _lock:
+        return {nombre: dict(info) for nombre, info in ESTADO_DEPENDENCIAS.items()}
@@ -0,0 +1,134 @@
+import os
+import json
+from contextvars import ContextVar
+from typing import TypedDict
+
+
+class Tenant(TypedDict, total=False):
+    """
+    Configuración aislada de un cliente cuando el bot corre en modo multi-tenant.
+    """
+    id: str
+    # Account de Chatwoot al que pertenecen los webhooks de este cliente
+    chatwoot_account_id: str
+    # Prompt propio del cliente (si falta se usa prompts.SYSTEM_PROMPT)
+    system_prompt: str
+    # Variables propias del cliente: SPREADSHEET_ID, CALCOM_*, CHATWOOT_*, SMTP_*, ZEP_*, GOOGLE_TOKEN_FILE...
+    config: dict
+
+
+# Tenant implícito del modo clásico (un contenedor por cliente): todo sale del .env
+TENANT_DEFAULT: Tenant = {"id": "default", "chatwoot_account_id": "", "system_prompt": "", "config": {}}
+
+TENANTS_FILE = os.getenv("TENANTS_FILE", "tenants.json")
+
+# Tenant de la petición en curso. asyncio.create_task y asyncio.to_thread copian el contexto,
+# así que lo que se fije en el webhook llega solo a LangGraph, las tools y los envíos a Chatwoot.
+tenant_actual: ContextVar[Tenant] = ContextVar("tenant_actual", default=TENANT_DEFAULT)
+
+# Secretos e identidad de cada cliente: en modo multi-tenant nunca se heredan del .env global ni del default del
+# llamador. Si el tenant no los define, config_tenant devuelve None y la integración queda "no configurada" para él.
+CLAVES_POR_TENANT = frozenset({
+    "CHATWOOT_ACCESS_TOKEN", "SPREADSHEET_ID", "GOOGLE_TOKEN_FILE",
+    "SMTP_USER", "SMTP_PASS", "ADMIN_EMAIL", "CALCOM_API_KEY",
+})
+
+_tenants: dict[str, Tenant] | None = None
+_faltantes_avisados: set[tuple[str, str]] = set()
+
+
+def _cargar_tenants() -> dict[str, Tenant]:
+    """Lee TENANTS_FILE. Si no existe, el bot queda en modo single-tenant."""
+    if not os.path.exists(TENANTS_FILE):
+        return {}
+
+    with open(TENANTS_FILE, encoding="utf-8") as f:
+        data = json.load(f)
+
+    tenants = {}
+    base_dir = os.path.dirname(os.path.abspath(TENANTS_FILE))
+    for raw in data.get("tenants", []):
+        tenant_id = str(raw["id"])
+        prompt = raw.get("system_prompt", "")
+        if not prompt and raw.get("prompt_file"):
+            with open(os.path.join(base_dir, raw["prompt_file"]), encoding="utf-8") as pf:
+                prompt = pf.read()
+
+        tenants[tenant_id] = {
+            "id": tenant_id,
+            "chatwoot_account_id": str(raw.get("chatwoot_account_id", "")),
+            "system_prompt": prompt,
+            "config": {k: str(v) for k, v in raw.get("config", {}).items()},
+        }
+
+    print(f"🏘️ Modo multi-tenant: {len(tenants)} clientes cargados desde {TENANTS_FILE}")
+    for tenant in tenants.values():
+        faltantes = sorted(CLAVES_POR_TENANT - {k for k, v in tenant["config"].items() if v})
+        if faltantes:
+            print(f"⚠️ Tenant {tenant['id']} no define {', '.join(faltantes)}: esas integraciones quedan apagadas para él (no se usa el .env global)")
+    return tenants
+
+
+def obtener_tenants() -> dict[str, Tenant]:
+    global _tenants
+    if _tenants is None:
+        _tenants = _cargar_tenants()
+    return _tenants
+
+
+def modo_multitenant() -> bool:
+    return bool(obtener_tenants())
+
+
+def resolver_tenant(tenant_id: str | None = None, account_id=None) -> Tenant | None:
+    """
+    Determina a qué cliente pertenece un webhook, por ruta (/webhook/{tenant_id}) o por account id de Chatwoot.
+    En modo single-tenant siempre devuelve el tenant por defecto.
+    """
+    tenants = obtener_tenants()
+    if not tenants:
+        return TENANT_DEFAULT
+
+    if tenant_id:
+        return tenants.get(str(tenant_id))
+
+    if account_id is not None:
+        for tenant in tenants.values():
+            if tenant["chatwoot_account_id"] == str(account_id):
+                return tenant
+    return None
+
+
+def config_tenant(clave: str, default: str | None = None, tenant: Tenant | None = None) -> str | None:
+    """
+    Devuelve una variable de configuración del tenant (o del actual), heredando del .env global si el tenant no la define.
+    En modo multi-tenant las CLAVES_POR_TENANT no se heredan: sin valor propio devuelve None (falla cerrado).
+    """
+    tenant = tenant or tenant_actual.get()
+    valor = tenant.get("config", {}).get(clave)
+    if valor:
+        return valor
+    if tenant["id"] != TENANT_DEFAULT["id"]:
+        if clave == "CHATWOOT_ACCOUNT_ID" and tenant.get("chatwoot_account_id"):
+            return tenant["chatwoot_account_id"]
+        if clave in CLAVES_POR_TENANT:
+            if (tenant["id"], clave) not in _faltantes_avisados:
+                _faltantes_avisados.add((tenant["id"], clave))
+                print(f"🔒 Tenant {tenant['id']} sin {clave}: no se hereda del .env global")
+            return None
+    return os.environ.get(clave, default)
+
+
+def prompt_tenant(default: str) -> str:
+    return tenant_actual.get().get("system_prompt") or default
+
+
+def thread_id_para(conversation_id, tenant: Tenant | None = None) -> str:
+    """
+    Namespace del checkpoint de LangGraph (y de la sesión de Zep) para una conversación.
+    El tenant por defecto conserva el thread_id histórico (= conversation_id) para no perder memorias ya guardadas.
+    """
+    tenant = tenant or tenant_actual.get()
+    if tenant["id"] == TENANT_DEFAULT["id"]:
+        return str(conversation_id)
+    return f"{tenant['id']}:{conversation_id}"
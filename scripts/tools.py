@@ -1,16 +1,22 @@
 import os
 import os.path
-import requests
+import time
+import inspect
 from datetime import datetime, timedelta, timezone
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import tool
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from tenants import config_tenant
+from http_compartido import sesion_http
+import salud
+import plazos
+import trazas
+import cortacircuitos
+from cortacircuitos import CircuitoAbierto
 
 load_dotenv()
 
@@ -21,94 +27,228 @@ SCOPES = [
 
 SPREADSHEET_ID = '16_C-t632vZkq2c7AV1ryY3Tdiop3C6NmJdZKlup3yfE'
 
-def get_google_services():
-    """Autentica y devuelve los servicios de Sheets y Calendar."""
+# Las tools reciben el config del grafo (parámetro RunnableConfig, que LangChain inyecta y no expone al LLM)
+# y recortan sus timeouts al deadline del turno (ver plazos.py).
+MENSAJE_SIN_TIEMPO = "No alcanzó el tiempo para completar esta operación en este turno. Avísale al cliente que lo estás verificando y que enseguida le confirmas."
+# Con el circuito de la integración abierto (ver cortacircuitos.py) y sin un resultado anterior que servir
+MENSAJE_INTEGRACION_CAIDA = "{servicio} no está respondiendo en este momento (se está reintentando en segundo plano). Avísale al cliente que lo verificas y le confirmas en unos minutos; no inventes datos."
+
+def get_spreadsheet_id() -> str:
+    """Planilla del cliente actual (en modo multi-tenant cada cliente define la suya)."""
+    return config_tenant("SPREADSHEET_ID", SPREADSHEET_ID)
+
+def get_google_services(timeout: float | None = None):
+    """Autentica y devuelve los servicios de Sheets y Calendar. `timeout` acota cada request HTTP a Google."""
+    # Import perezoso: el stack de googleapiclient es de lo más pesado del arranque y solo lo usan estas tools
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from googleapiclient.discovery import build
+
     creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+    token_file = config_tenant("GOOGLE_TOKEN_FILE", "token.json")
+    if not token_file:
+        raise RuntimeError("El cliente no tiene GOOGLE_TOKEN_FILE propio en tenants.json")
+    if os.path.exists(token_file):
+        creds = Credentials.from_authorized_user_file(token_file, SCOPES)
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
         else:
             flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
             creds = flow.run_local_server(port=0)
-        with open('token.json', 'w') as token:
+        with open(token_file, 'w') as token:
             token.write(creds.to_json())
 
+    if timeout:
+        import httplib2
+        from google_auth_httplib2 import AuthorizedHttp
+        http = AuthorizedHttp(creds, http=httplib2.Http(timeout=timeout))
+        return build('sheets', 'v4', http=http), build('calendar', 'v3', http=http)
+
     sheets_service = build('sheets', 'v4', credentials=creds)
     calendar_service = build('calendar', 'v3', credentials=creds)
     return sheets_service, calendar_service
 
-def consultar_propiedades(zona: str = None, presupuesto_maximo: int = None) -> str:
-    """Busca en la base de datos (Google Sheets) las propiedades disponibles."""
+def precargar_google():
+    """Importa el stack de Google durante el warmup para que la primera consulta del lead no pague ese costo."""
+    inicio = time.perf_counter()
     try:
-        sheets_service, _ = get_google_services()
-        sheet = sheets_service.spreadsheets()
-
-        # Obtenemos metadata para saber las hojas que existen
-        sheet_metadata = sheet.get(spreadsheetId=SPREADSHEET_ID).execute()
-        sheets = sheet_metadata.get('sheets', [])
-
-        # Intentamos buscar especificamente la hoja que dice "propiedades"
-        nombre_primera_hoja = "propiedades"
-        for s in sheets:
-            titulo = s.get("properties", {}).get("title", "")
-            if "propiedades" in titulo.lower():
-                nombre_primera_hoja = titulo
-                break
-
-        # Ajustamos el rango a A:G para incluir imágenes
-        rango = f"'{nombre_primera_hoja}'!A:G"
+        import googleapiclient.discovery  # noqa: F401
+        import google.oauth2.credentials  # noqa: F401
+        token_file = config_tenant("GOOGLE_TOKEN_FILE", "token.json")
+        if not token_file:
+            salud.registrar("google", "degradado", "El cliente no define GOOGLE_TOKEN_FILE", time.perf_counter() - inicio)
+        elif os.path.exists(token_file):
+            salud.registrar("google", "ok", token_file, time.perf_counter() - inicio)
+        else:
+            salud.registrar("google", "degradado", f"Falta {token_file} (correr auth_google.py)", time.perf_counter() - inicio)
+    except Exception as e:
+        salud.registrar("google", "error", str(e), time.perf_counter() - inicio)
+
+# El catálogo se relee de Sheets como máximo cada CATALOGO_TTL_SEGUNDOS; entre lecturas las búsquedas son 100% locales
+CATALOGO_TTL_SEGUNDOS = int(os.getenv("CATALOGO_TTL_SEGUNDOS", "60"))
+CATALOGO_TOP_K = int(os.getenv("CATALOGO_TOP_K", "3"))
+# Con Sheets caído se sigue buscando sobre el último catálogo leído, hasta esta antigüedad
+CATALOGO_MAX_ANTIGUEDAD = int(os.getenv("CATALOGO_MAX_ANTIGUEDAD", str(24 * 3600)))
+_cache_catalogo: dict[str, tuple[float, list[dict]]] = {}
+
+def _leer_catalogo(spreadsheet_id: str, timeout: float | None = None) -> list[dict]:
+    """Lee la hoja de propiedades de Google Sheets y la devuelve como lista de dicts."""
+    sheets_service, _ = get_google_services(timeout)
+    sheet = sheets_service.spreadsheets()
+
+    # Obtenemos metadata para saber las hojas que existen
+    sheet_metadata = sheet.get(spreadsheetId=spreadsheet_id).execute()
+    sheets = sheet_metadata.get('sheets', [])
+
+    # Intentamos buscar especificamente la hoja que dice "propiedades"
+    nombre_primera_hoja = "propiedades"
+    for s in sheets:
+        titulo = s.get("properties", {}).get("title", "")
+        if "propiedades" in titulo.lower():
+            nombre_primera_hoja = titulo
+            break
+
+    # Ajustamos el rango a A:G para incluir imágenes
+    rango = f"'{nombre_primera_hoja}'!A:G"
+
+    result = sheet.values().get(spreadsheetId=spreadsheet_id, range=rango).execute()
+    values = result.get('values', [])
+    if not values:
+        return []
+
+    header = values[0]
+    propiedades = []
+
+    # Ignora la fila 0 (headers)
+    for row in values[1:]:
+        # Padding por si las filas están incompletas
+        row += [''] * (len(header) - len(row))
+        precio_str = row[3] if len(row) > 3 else '0'
+        # Limpiar el precio asumiendo string tipo "USD 450,000" o "$5000000"
+        precio_limpio = ''.join(c for c in str(precio_str) if c.isdigit())
+        propiedades.append({
+            "id": row[0] if len(row) > 0 else '0',
+            "nombre": row[1] if len(row) > 1 else 'N/A',
+            "zona": row[2] if len(row) > 2 else 'N/A',
+            "precio_str": precio_str,
+            "precio": int(precio_limpio) if precio_limpio else 0,
+            "descripcion": row[4] if len(row) > 4 else '',
+            "rentabilidad": row[5] if len(row) > 5 else '',
+            "imagenes": row[6] if len(row) > 6 else '',
+        })
+    return propiedades
+
+def _refrescar_catalogo(spreadsheet_id: str, timeout: float | None = None) -> list[dict]:
+    from catalogo import indice_para
+
+    propiedades = _leer_catalogo(spreadsheet_id, timeout)
+    _cache_catalogo[spreadsheet_id] = (time.time(), propiedades)
+    indice_para(spreadsheet_id).actualizar(propiedades)
+    return propiedades
+
+def _sonda_sheets():
+    # La sonda del circuito es una relectura real: si Sheets volvió, el catálogo queda fresco de paso
+    _refrescar_catalogo(get_spreadsheet_id(), cortacircuitos.CORTACIRCUITOS_TIMEOUT_SONDA)
+
+def _obtener_catalogo(timeout: float | None = None) -> tuple[str, list[dict], float | None]:
+    """
+    Catálogo del cliente actual, con caché por TTL. Cada relectura actualiza el índice de similitud de forma incremental.
+    Si Sheets falla (o su circuito está abierto) se sirve el último catálogo leído: el tercer valor es su antigüedad en
+    segundos (None si está al día).
+    """
+    spreadsheet_id = get_spreadsheet_id()
+    cache = _cache_catalogo.get(spreadsheet_id)
+    if cache and time.time() - cache[0] < CATALOGO_TTL_SEGUNDOS:
+        return spreadsheet_id, cache[1], None
 
-        result = sheet.values().get(spreadsheetId=SPREADSHEET_ID, range=rango).execute()
-        values = result.get('values', [])
+    try:
+        circuito = cortacircuitos.circuito("sheets", sonda=_sonda_sheets)
+        propiedades = circuito.ejecutar(lambda: _refrescar_catalogo(spreadsheet_id, timeout), timeout)
+    except Exception as e:
+        if not cache or time.time() - cache[0] > CATALOGO_MAX_ANTIGUEDAD:
+            raise
+        if not isinstance(e, CircuitoAbierto):
+            print(f"⚠️ Sheets falló, se sirve el catálogo anterior: {e}")
+        return spreadsheet_id, cache[1], time.time() - cache[0]
+    return spreadsheet_id, propiedades, None
+
+def _formatear_propiedad(p: dict) -> str:
+    return f"- **[ID: {p['id']}] {p['nombre']}** en {p['zona']} ({p['precio_str']})\n  Detalle: {p['descripcion']}\n  Rentabilidad: {p['rentabilidad']}\n  Imágenes: {p['imagenes']}\n"
+
+@tool
+def consultar_propiedades(zona: str = None, presupuesto_maximo: int = None, consulta: str = None, config: RunnableConfig = None) -> str:
+    """Busca en la base de datos (Google Sheets) las propiedades disponibles.
+    Usa `consulta` cuando el cliente describe lo que busca con sus palabras; devuelve solo las opciones más afines.
+    Args:
+        zona: Zona o ciudad de interés (ej: 'Tulum'). Opcional.
+        presupuesto_maximo: Tope de precio en USD; filtra tanto la búsqueda por `zona` como por `consulta`. Omítelo si quieres ofrecer opciones por encima del presupuesto (upselling). Opcional.
+        consulta: Descripción libre de lo que busca el cliente (ej: 'algo con pileta cerca del río para invertir'). Opcional.
+    """
+    try:
+        if plazos.agotado(config):
+            return MENSAJE_SIN_TIEMPO
+        spreadsheet_id, propiedades, antiguedad = _obtener_catalogo(plazos.tiempo_restante(config, maximo=10.0, minimo=1.0))
 
-        if not values:
+        if not propiedades:
             return "No se encontraron propiedades en la base de datos."
 
-        header = values[0]
-        propiedades_encontradas = []
+        # Catálogo servido desde el último leído: precios/disponibilidad pueden haber cambiado
+        aviso = (
+            f"⚠️ CATÁLOGO DE HACE {cortacircuitos.antiguedad_legible(antiguedad).upper()} (la base de datos no responde): "
+            "no confirmes precio ni disponibilidad como definitivos; di que lo verificas con el asesor.\n"
+        ) if antiguedad is not None else ""
 
-        # Ignora la fila 0 (headers)
-        for row in values[1:]:
-            # Padding por si las filas están incompletas
-            row += [''] * (len(header) - len(row))
-            id_prop = row[0] if len(row) > 0 else '0'
-            nombre = row[1] if len(row) > 1 else 'N/A'
-            zona_prop = row[2] if len(row) > 2 else 'N/A'
-            precio_str = row[3] if len(row) > 3 else '0'
-            desc = row[4] if len(row) > 4 else ''
-            rentabilidad = row[5] if len(row) > 5 else ''
-            imagenes = row[6] if len(row) > 6 else ''
-
-            # Limpiar el precio asumiendo string tipo "USD 450,000" o "$5000000"
-            precio_limpio = ''.join(c for c in str(precio_str) if c.isdigit())
-            precio = int(precio_limpio) if precio_limpio else 0
-
-            # Filtros básicos (case-insensitive para zona)
-            match_zona = not zona or zona.lower() in str(zona_prop).lower()
+        if consulta:
+            from catalogo import indice_para
+            resultados = indice_para(spreadsheet_id).buscar(
+                consulta, top_k=CATALOGO_TOP_K, presupuesto_maximo=presupuesto_maximo, zona=zona
+            )
+            if not resultados:
+                return f"No encontré propiedades que se ajusten a '{consulta}'. Pregúntale al cliente qué es lo más importante para él y vuelve a buscar."
+            return aviso + "Estas son las opciones de la base de datos más afines a lo que busca el cliente (de mayor a menor afinidad):\n" + "\n".join(
+                _formatear_propiedad(p) for _, p in resultados
+            )
 
-            if match_zona:
-                prop_info = f"- **[ID: {id_prop}] {nombre}** en {zona_prop} ({precio_str})\n  Detalle: {desc}\n  Rentabilidad: {rentabilidad}\n  Imágenes: {imagenes}\n"
-                propiedades_encontradas.append(prop_info)
+        # Filtros básicos (case-insensitive para zona). Igual que en el índice, una propiedad sin precio cargado (0)
+        # no se descarta por el tope
+        propiedades_encontradas = [
+            _formatear_propiedad(p) for p in propiedades
+            if (not zona or zona.lower() in str(p["zona"]).lower())
+            and (not presupuesto_maximo or not p["precio"] or p["precio"] <= presupuesto_maximo)
+        ]
 
         if propiedades_encontradas:
-            return "Aquí tienes las opciones en la base de datos para esa zona:\n" + "\n".join(propiedades_encontradas)
+            return aviso + "Aquí tienes las opciones en la base de datos para esa búsqueda:\n" + "\n".join(propiedades_encontradas)
+        elif presupuesto_maximo:
+            donde = f" en {zona}" if zona else ""
+            return f"Actualmente no cuento con propiedades{donde} de hasta USD {presupuesto_maximo}."
         else:
             return f"Actualmente no cuento con propiedades en {zona}."
 
+    except CircuitoAbierto:
+        return MENSAJE_INTEGRACION_CAIDA.format(servicio="La base de datos de propiedades")
     except Exception as e:
         print(f"\n\n🚨 GOOGLE API ERROR ---> {str(e)}\n\n")
         return f"Error al consultar la base de datos de propiedades: {str(e)}"
 
-def registrar_lead(nombre: str, contacto: str, presupuesto: str, zona: str, urgencia: str) -> str:
+@tool
+def registrar_lead(nombre: str, contacto: str, presupuesto: str, zona: str, urgencia: str, config: RunnableConfig = None) -> str:
     """Registra los datos del cliente calificado en la pestaña 'Leads' del Google Sheet."""
     try:
-        sheets_service, _ = get_google_services()
+        # Escritura: no la arrancamos si no hay margen para terminarla (evita duplicados por reintento)
+        if plazos.agotado(config, margen=2.0):
+            return MENSAJE_SIN_TIEMPO
+        # Con Sheets caído falla al instante: una escritura no tiene resultado anterior que servir
+        circuito = cortacircuitos.circuito("sheets", sonda=_sonda_sheets)
+        timeout = plazos.tiempo_restante(config, maximo=10.0, minimo=1.0)
+        sheets_service, _ = get_google_services(timeout)
         sheet = sheets_service.spreadsheets()
+        spreadsheet_id = get_spreadsheet_id()
 
         # Obtenemos metadata para encontrar una hoja que contenga "lead" en el nombre
-        sheet_metadata = sheet.get(spreadsheetId=SPREADSHEET_ID).execute()
+        sheet_metadata = circuito.ejecutar(lambda: sheet.get(spreadsheetId=spreadsheet_id).execute(), timeout)
         sheets_list = sheet_metadata.get('sheets', '')
 
         nombre_hoja_leads = None
@@ -137,14 +277,16 @@ def registrar_lead(nombre: str, contacto: str, presupuesto: str, zona: str, urge
             'values': valores
         }
 
-        sheets_service.spreadsheets().values().append(
-            spreadsheetId=SPREADSHEET_ID,
+        circuito.ejecutar(lambda: sheets_service.spreadsheets().values().append(
+            spreadsheetId=spreadsheet_id,
             range=rango,
             valueInputOption="USER_ENTERED",
             body=body
-        ).execute()
+        ).execute(), timeout)
 
         return f"Lead ({nombre}) registrado exitosamente en el CRM."
+    except CircuitoAbierto:
+        return MENSAJE_INTEGRACION_CAIDA.format(servicio="El CRM (Google Sheets)") + " Conserva sus datos para volver a intentar el registro más adelante en la conversación."
     except Exception as e:
         return f"Error al registrar el lead: {str(e)}"
 
@@ -154,16 +296,64 @@ def registrar_lead(nombre: str, contacto: str, presupuesto: str, zona: str, urge
 # Sincroniza automáticamente, aplica reglas de negocio y maneja zonas horarias.
 # =============================================================================
 
+@tool
 def obtener_link_agenda() -> str:
     """Devuelve el link público de Cal.com para que el cliente elija su propio horario de forma autónoma.
     Úsalo cuando el cliente prefiera auto-agendarse en el horario que más le convenga.
     """
     # El link de reserva siempre usa cal.com (frontend público), no la URL de la API.
-    calcom_username = os.environ.get("CALCOM_USERNAME", "broker")
-    calcom_event_slug = os.environ.get("CALCOM_EVENT_SLUG", "30min")
+    calcom_username = config_tenant("CALCOM_USERNAME", "broker")
+    calcom_event_slug = config_tenant("CALCOM_EVENT_SLUG", "30min")
     return f"Link de reserva: https://cal.com/{calcom_username}/{calcom_event_slug}"
 
-def obtener_slots_disponibles(fecha_inicio: str, fecha_fin: str) -> str:
+# Últimos slots buenos por (Cal.com, evento, rango): con Cal.com caído se ofrecen marcados como posiblemente viejos.
+# Es seguro porque agendar_cita_calcom vuelve a validar el horario contra Cal.com al reservar.
+CALCOM_SLOTS_MAX_ANTIGUEDAD = int(os.getenv("CALCOM_SLOTS_MAX_ANTIGUEDAD", "1800"))
+_ultimos_slots = cortacircuitos.UltimoBueno()
+
+def _sonda_calcom():
+    calcom_url = config_tenant("CALCOM_URL", "")
+    hoy = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    resp = sesion_http.get(
+        f"{calcom_url}/v2/slots",
+        headers={"Authorization": f"Bearer {config_tenant('CALCOM_API_KEY', '')}", "cal-api-version": "2024-09-04"},
+        params={"eventTypeId": config_tenant("CALCOM_EVENT_TYPE_ID", "1"), "start": hoy, "end": hoy},
+        timeout=cortacircuitos.CORTACIRCUITOS_TIMEOUT_SONDA,
+    )
+    if resp.status_code >= 500 or resp.status_code == 429:
+        resp.raise_for_status()
+
+def _formatear_slots(slots_data: dict) -> str:
+    resultado = "HORARIOS DISPONIBLES (verificados y libres en la agenda real):\n"
+    for fecha, slots in sorted(slots_data.items()):
+        if slots:
+            # Cal.com devuelve los tiempos ya en la timeZone solicitada
+            horas = []
+            for s in slots:
+                try:
+                    t = s.get("start") or s.get("time")
+                    if not t:
+                        continue
+                    # Validar si termina en Z (UTC)
+                    if t.endswith('Z'):
+                        t = t[:-1] + '+00:00'
+                    
+                    dt_obj = datetime.fromisoformat(t)
+                    # Forzar conversión a GMT-3
+                    dt_local = dt_obj.astimezone(timezone(timedelta(hours=-3)))
+                    hora = dt_local.strftime("%H:%M")
+                    
+                    horas.append(hora)
+                except Exception as e:
+                    print(f"Error parseando hora slot: {e}")
+            if horas:
+                resultado += f"- {fecha}: {', '.join(horas)} (hora Argentina, GMT-3)\n"
+
+    resultado += "\n🚨 REGLA DE PRESENTACIÓN: El cliente ya te indicó si prefiere mañana o tarde. Filtra mentalmente esta lista y ofrécele TODOS los horarios disponibles de ese turno en forma clara. IMPORTANTE: Tu meta es vender; si el cliente te pide un horario específico (ej: las 12) y ESE HORARIO ESTÁ EN LA LISTA, dile que SÍ de forma inmediata y avanza con el inicio de la cita, sin importar si consideras que las 12 es 'mañana' o 'tarde'."
+    return resultado
+
+@tool
+def obtener_slots_disponibles(fecha_inicio: str, fecha_fin: str, config: RunnableConfig = None) -> str:
     """Consulta los horarios DISPONIBLES en Cal.com para un rango de fechas.
     Devuelve una lista real de slots libres, ya filtrados por disponibilidad real del calendario.
     SIEMPRE usa esta herramienta antes de agendar para no inventar horarios.
@@ -171,14 +361,18 @@ def obtener_slots_disponibles(fecha_inicio: str, fecha_fin: str) -> str:
         fecha_inicio: Fecha de inicio en formato YYYY-MM-DD (ej: '2026-03-10')
         fecha_fin: Fecha de fin en formato YYYY-MM-DD (ej: '2026-03-12')
     """
+    calcom_url = config_tenant("CALCOM_URL", "")
+    event_type_id = config_tenant("CALCOM_EVENT_TYPE_ID", "1")
+    clave_cache = (calcom_url, event_type_id, fecha_inicio, fecha_fin)
     try:
-        calcom_url = os.environ.get("CALCOM_URL", "")
-        api_key = os.environ.get("CALCOM_API_KEY", "")
-        event_type_id = os.environ.get("CALCOM_EVENT_TYPE_ID", "1")
+        api_key = config_tenant("CALCOM_API_KEY", "")
 
         if not calcom_url or not api_key or api_key == "COMPLETAR_DESPUES_DEL_SETUP":
             return "Error: Cal.com no configurado. El administrador debe completar CALCOM_API_KEY en el .env."
 
+        if plazos.agotado(config):
+            return MENSAJE_SIN_TIEMPO
+
         headers = {
             "Authorization": f"Bearer {api_key}",
             "cal-api-version": "2024-09-04"
@@ -189,49 +383,37 @@ def obtener_slots_disponibles(fecha_inicio: str, fecha_fin: str) -> str:
             "end": fecha_fin,
             "timeZone": "America/Argentina/Buenos_Aires"
         }
-        resp = requests.get(
-            f"{calcom_url}/v2/slots",
-            headers=headers, params=params, timeout=10
-        )
-        resp.raise_for_status()
-        data = resp.json()
+        timeout = plazos.tiempo_restante(config, maximo=10.0, minimo=1.0)
+
+        def _consultar():
+            resp = sesion_http.get(f"{calcom_url}/v2/slots", headers=headers, params=params, timeout=timeout)
+            resp.raise_for_status()
+            return resp.json()
+
+        data = cortacircuitos.circuito("calcom", sonda=_sonda_calcom).ejecutar(_consultar, timeout)
 
         # La respuesta tiene formato: {"data": {"2026-03-05": [{"time": "..."}]}, "status": "success"}
         slots_data = data.get("data", {})
+        _ultimos_slots.guardar(clave_cache, slots_data)
         if not slots_data:
             return "No hay horarios disponibles para ese rango de fechas. Propón otro día al cliente."
 
-        resultado = "HORARIOS DISPONIBLES (verificados y libres en la agenda real):\n"
-        for fecha, slots in sorted(slots_data.items()):
-            if slots:
-                # Cal.com devuelve los tiempos ya en la timeZone solicitada
-                horas = []
-                for s in slots:
-                    try:
-                        t = s.get("start") or s.get("time")
-                        if not t:
-                            continue
-                        # Validar si termina en Z (UTC)
-                        if t.endswith('Z'):
-                            t = t[:-1] + '+00:00'
-                        
-                        dt_obj = datetime.fromisoformat(t)
-                        # Forzar conversión a GMT-3
-                        dt_local = dt_obj.astimezone(timezone(timedelta(hours=-3)))
-                        hora = dt_local.strftime("%H:%M")
-                        
-                        horas.append(hora)
-                    except Exception as e:
-                        print(f"Error parseando hora slot: {e}")
-                if horas:
-                    resultado += f"- {fecha}: {', '.join(horas)} (hora Argentina, GMT-3)\n"
-
-        resultado += "\n🚨 REGLA DE PRESENTACIÓN: El cliente ya te indicó si prefiere mañana o tarde. Filtra mentalmente esta lista y ofrécele TODOS los horarios disponibles de ese turno en forma clara. IMPORTANTE: Tu meta es vender; si el cliente te pide un horario específico (ej: las 12) y ESE HORARIO ESTÁ EN LA LISTA, dile que SÍ de forma inmediata y avanza con el inicio de la cita, sin importar si consideras que las 12 es 'mañana' o 'tarde'."
-        return resultado
+        return _formatear_slots(slots_data)
     except Exception as e:
+        anterior = _ultimos_slots.obtener(clave_cache, CALCOM_SLOTS_MAX_ANTIGUEDAD)
+        if anterior is not None and (isinstance(e, CircuitoAbierto) or cortacircuitos.es_falla_del_servicio(e)):
+            slots_data, antiguedad = anterior
+            if slots_data:
+                return (
+                    f"⚠️ HORARIOS CONSULTADOS HACE {cortacircuitos.antiguedad_legible(antiguedad).upper()} (la agenda no responde ahora): "
+                    "alguno pudo ocuparse. Ofrécelos igual; al agendar se vuelve a verificar y, si ya no está libre, ofrece otro.\n"
+                ) + _formatear_slots(slots_data)
+        if isinstance(e, CircuitoAbierto):
+            return MENSAJE_INTEGRACION_CAIDA.format(servicio="La agenda (Cal.com)")
         return f"Error consultando disponibilidad en Cal.com: {str(e)}"
 
-def agendar_cita_calcom(fecha_hora_utc: str, nombre_cliente: str, email_cliente: str, zona_horaria_cliente: str = "America/Argentina/Buenos_Aires", motivo: str = "Asesoría Inmobiliaria") -> str:
+@tool
+def agendar_cita_calcom(fecha_hora_utc: str, nombre_cliente: str, email_cliente: str, zona_horaria_cliente: str = "America/Argentina/Buenos_Aires", motivo: str = "Asesoría Inmobiliaria", config: RunnableConfig = None) -> str:
     """Crea una reserva en Cal.com. Cal.com la sincroniza automáticamente con Google Calendar y genera el link de videollamada.
     ⚠️ La fecha/hora DEBE estar en formato UTC (ej: '2026-03-05T12:00:00Z').
     Si el cliente eligió las 09:00 (GMT-3), convierte a UTC sumando 3 horas: '2026-03-05T12:00:00Z'.
@@ -243,9 +425,9 @@ def agendar_cita_calcom(fecha_hora_utc: str, nombre_cliente: str, email_cliente:
         motivo: Propiedad o zona de interés para incluir en el título de la cita.
     """
     try:
-        calcom_url = os.environ.get("CALCOM_URL", "")
-        api_key = os.environ.get("CALCOM_API_KEY", "")
-        event_type_id = int(os.environ.get("CALCOM_EVENT_TYPE_ID", "1"))
+        calcom_url = config_tenant("CALCOM_URL", "")
+        api_key = config_tenant("CALCOM_API_KEY", "")
+        event_type_id = int(config_tenant("CALCOM_EVENT_TYPE_ID", "1"))
 
         if not calcom_url or not api_key or api_key == "COMPLETAR_DESPUES_DEL_SETUP":
             return "Error: Cal.com no configurado. El administrador debe completar CALCOM_API_KEY en el .env."
@@ -253,6 +435,10 @@ def agendar_cita_calcom(fecha_hora_utc: str, nombre_cliente: str, email_cliente:
         if not email_cliente or "@" not in email_cliente:
             return "ACCIÓN REQUERIDA: No tengo el correo del cliente. Debo pedírselo antes de poder agendar. Pregúntale su email."
 
+        # Escritura: si el timeout cortara a mitad de camino no sabríamos si la reserva quedó creada
+        if plazos.agotado(config, margen=3.0):
+            return MENSAJE_SIN_TIEMPO
+
         headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
@@ -271,12 +457,15 @@ def agendar_cita_calcom(fecha_hora_utc: str, nombre_cliente: str, email_cliente:
                 "notes": f"Interés en: {motivo}"
             }
         }
-        resp = requests.post(
-            f"{calcom_url}/v2/bookings",
-            headers=headers, json=body, timeout=10
-        )
-        resp.raise_for_status()
-        data = resp.json()
+        timeout = plazos.tiempo_restante(config, maximo=10.0, minimo=3.0)
+
+        def _reservar():
+            resp = sesion_http.post(f"{calcom_url}/v2/bookings", headers=headers, json=body, timeout=timeout)
+            resp.raise_for_status()
+            return resp.json()
+
+        # Con Cal.com caído falla al instante: nunca se "reserva" sobre un resultado anterior
+        data = cortacircuitos.circuito("calcom", sonda=_sonda_calcom).ejecutar(_reservar, timeout)
 
         booking = data.get("data", {})
         meet_link = booking.get("meetingUrl", "")
@@ -288,21 +477,24 @@ def agendar_cita_calcom(fecha_hora_utc: str, nombre_cliente: str, email_cliente:
             f"Link de videollamada: {meet_link}. "
             f"Se enviará una invitación automática al correo {email_cliente}."
         )
+    except CircuitoAbierto:
+        return MENSAJE_INTEGRACION_CAIDA.format(servicio="La agenda (Cal.com)") + " No confirmes la cita hasta poder reservarla."
     except Exception as e:
         return f"Error al crear la reserva en Cal.com: {str(e)}. Verifica que la hora esté en formato UTC y que el slot siga disponible."
 
-def transferir_a_humano(motivo_transferencia: str) -> str:
+@tool
+def transferir_a_humano(motivo_transferencia: str, config: RunnableConfig = None) -> str:
     """Detiene la conversación con la IA y transfiere el caso a un Asesor Humano real.
        Usa esta herramienta DENTRO DEL GRAFO si el cliente se enoja, se atasca o lo pide explícitamente.
        Args:
            motivo_transferencia: Breve resumen para el humano de por qué estás abandonando el chat.
     """
     try:
-        smtp_user = os.environ.get('SMTP_USER')
-        smtp_pass = os.environ.get('SMTP_PASS')
-        smtp_host = os.environ.get('SMTP_ADDRESS') or 'smtp.gmail.com'
-        smtp_port = int(os.environ.get('SMTP_PORT') or 587)
-        admin_email = os.environ.get('ADMIN_EMAIL') or smtp_user
+        smtp_user = config_tenant('SMTP_USER')
+        smtp_pass = config_tenant('SMTP_PASS')
+        smtp_host = config_tenant('SMTP_ADDRESS') or 'smtp.gmail.com'
+        smtp_port = int(config_tenant('SMTP_PORT') or 587)
+        admin_email = config_tenant('ADMIN_EMAIL') or smtp_user
 
         if smtp_user and smtp_pass:
             msg = MIMEMultipart()
@@ -316,7 +508,8 @@ def transferir_a_humano(motivo_transferencia: str) -> str:
             )
             msg.attach(MIMEText(body, 'plain'))
 
-            server = smtplib.SMTP(smtp_host, smtp_port)
+            # El aviso al humano sale aunque el turno esté vencido: piso de 3s
+            server = smtplib.SMTP(smtp_host, smtp_port, timeout=plazos.tiempo_restante(config, maximo=10.0, minimo=3.0))
             server.starttls()
             server.login(smtp_user, smtp_pass)
             server.send_message(msg)
@@ -332,3 +525,10 @@ def transferir_a_humano(motivo_transferencia: str) -> str:
     return f"HITL_TRIGGERED||{motivo_transferencia}"
 
 TOOLS = [consultar_propiedades, registrar_lead, obtener_link_agenda, obtener_slots_disponibles, agendar_cita_calcom, transferir_a_humano]
+
+# Un span por ejecución de cada tool. Se envuelve la función detrás de cada @tool (no el objeto) para que el schema
+# que ve el LLM no cambie; functools.wraps conserva la firma, así StructuredTool sigue inyectando el `config`.
+# @tool copia el docstring crudo: se le saca la sangría para no mandarla en cada llamada.
+for _herramienta in TOOLS:
+    _herramienta.description = inspect.cleandoc(_herramienta.description)
+    _herramienta.func = trazas.trazar(f"tool.{_herramienta.name}")(_herramienta.func)
@@ -0,0 +1,304 @@
+"""
+Trazas por turno: spans (webhook -> procesar_langgraph -> nodos del grafo -> tools / LLM / Zep -> Chatwoot)
+exportados a un JSONL local rotativo, agrupados por conversación.
+
+Uso como CLI (waterfall y ruta crítica de un turno):
+    python trazas.py 123                 # último turno de la conversación 123
+    python trazas.py 123 --turno -2      # anteúltimo
+    python trazas.py 123 --listar        # todos los turnos de la conversación con su duración
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import asyncio
+import argparse
+import functools
+import threading
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+TRAZAS_ACTIVAS = os.getenv("TRAZAS_ACTIVAS", "1") == "1"
+TRAZAS_PATH = os.getenv("TRAZAS_PATH", "../.tmp/trazas/trazas.jsonl")
+TRAZAS_MAX_BYTES = int(os.getenv("TRAZAS_MAX_BYTES", str(10 * 1024 * 1024)))
+TRAZAS_ARCHIVOS = int(os.getenv("TRAZAS_ARCHIVOS", "5"))
+
+# Span abierto en el contexto actual. asyncio.create_task y asyncio.to_thread copian el contexto,
+# así que los spans del grafo (en un hilo) y de las burbujas quedan colgados del webhook que los originó.
+_span_actual: ContextVar[dict | None] = ContextVar("span_actual", default=None)
+
+_logger: logging.Logger | None = None
+_logger_lock = threading.Lock()
+
+
+def _exportador() -> logging.Logger:
+    """Logger dedicado: los spans se encolan y un hilo del QueueListener escribe y rota el archivo."""
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                os.makedirs(os.path.dirname(os.path.abspath(TRAZAS_PATH)), exist_ok=True)
+                archivo = RotatingFileHandler(TRAZAS_PATH, maxBytes=TRAZAS_MAX_BYTES, backupCount=TRAZAS_ARCHIVOS, encoding="utf-8", delay=True)
+                archivo.setFormatter(logging.Formatter("%(message)s"))
+                cola = queue.SimpleQueue()
+                listener = QueueListener(cola, archivo)
+                listener.start()
+                atexit.register(listener.stop)
+                logger = logging.getLogger("trazas")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.addHandler(QueueHandler(cola))
+                _logger = logger
+    return _logger
+
+
+def _exportar(datos: dict):
+    try:
+        _exportador().info(json.dumps(datos, ensure_ascii=False, default=str))
+    except Exception as e:
+        print(f"Error exportando span {datos.get('nombre')}: {e}")
+
+
+@contextmanager
+def span(nombre: str, conversacion: str | None = None, **atributos):
+    """
+    Abre un span hijo del span actual (o una traza nueva si no hay ninguno).
+    Devuelve el dict del span: se le pueden agregar atributos mientras está abierto (datos["atributos"][...]).
+    """
+    if not TRAZAS_ACTIVAS:
+        yield {"atributos": {}}
+        return
+    padre = _span_actual.get()
+    datos = {
+        "traza": padre["traza"] if padre else uuid.uuid4().hex[:16],
+        "id": uuid.uuid4().hex[:16],
+        "padre": padre["id"] if padre else None,
+        "nombre": nombre,
+        "conversacion": conversacion or (padre or {}).get("conversacion"),
+        "inicio": time.time(),
+        "hilo": threading.current_thread().name,
+        "atributos": atributos,
+    }
+    token = _span_actual.set(datos)
+    inicio = time.perf_counter()
+    try:
+        yield datos
+    except BaseException as e:
+        # BaseException: una tarea cancelada también cierra su span
+        datos["error"] = repr(e)
+        raise
+    finally:
+        datos["duracion_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+        _span_actual.reset(token)
+        _exportar(datos)
+
+
+def trazar(nombre: str | None = None):
+    """Decorador: cada llamada a la función (sync o async) es un span. Con las trazas apagadas no envuelve nada."""
+    def decorador(funcion):
+        if not TRAZAS_ACTIVAS:
+            return funcion
+        etiqueta = nombre or funcion.__name__
+
+        if asyncio.iscoroutinefunction(funcion):
+            @functools.wraps(funcion)
+            async def envoltura_async(*args, **kwargs):
+                with span(etiqueta):
+                    return await funcion(*args, **kwargs)
+            return envoltura_async
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with span(etiqueta):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def fijar_conversacion(conversacion: str):
+    """Asigna la conversación al span actual (el webhook recién la conoce después de parsear el body). Los hijos la heredan."""
+    actual = _span_actual.get()
+    if actual is not None:
+        actual["conversacion"] = str(conversacion)
+
+
+def contexto_actual() -> dict | None:
+    """Referencia serializable al span actual, para continuar la traza en otro proceso (ver fragmentos.py)."""
+    actual = _span_actual.get()
+    if actual is None:
+        return None
+    return {"traza": actual["traza"], "id": actual["id"], "conversacion": actual.get("conversacion")}
+
+
+@contextmanager
+def continuar(contexto: dict | None):
+    """Los spans abiertos dentro cuelgan del span remoto `contexto` (el webhook que originó la tarea)."""
+    if not contexto:
+        yield
+        return
+    token = _span_actual.set(contexto)
+    try:
+        yield
+    finally:
+        _span_actual.reset(token)
+
+
+def anotar(**atributos):
+    """Agrega atributos al span actual (ej. tokens del LLM, cantidad de burbujas)."""
+    actual = _span_actual.get()
+    if actual is not None and "atributos" in actual:
+        actual["atributos"].update(atributos)
+
+
+# --- CLI: lectura, waterfall y ruta crítica ---
+
+def _leer_spans(ruta: str) -> list[dict]:
+    """Lee el archivo actual y sus rotaciones (.1 ... .N)."""
+    archivos = [f"{ruta}.{i}" for i in range(TRAZAS_ARCHIVOS, 0, -1)] + [ruta]
+    spans = []
+    for archivo in archivos:
+        if not os.path.exists(archivo):
+            continue
+        with open(archivo, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    spans.append(json.loads(linea))
+                except ValueError:
+                    continue
+    return spans
+
+
+def _es_de_conversacion(span_: dict, conversacion: str) -> bool:
+    # El thread_id de un tenant no default viene con namespace ("inmo_norte:123")
+    actual = str(span_.get("conversacion") or "")
+    return actual == conversacion or actual.endswith(f":{conversacion}")
+
+
+def turnos_de(spans: list[dict], conversacion: str) -> list[list[dict]]:
+    """Trazas (turnos) de una conversación, ordenadas por inicio."""
+    trazas_ids = {s["traza"] for s in spans if _es_de_conversacion(s, conversacion)}
+    por_traza: dict[str, list[dict]] = {}
+    for s in spans:
+        if s["traza"] in trazas_ids:
+            por_traza.setdefault(s["traza"], []).append(s)
+    return sorted(por_traza.values(), key=lambda t: min(s["inicio"] for s in t))
+
+
+def _fin(s: dict) -> float:
+    return s["inicio"] + s["duracion_ms"] / 1000
+
+
+def _arbol(turno: list[dict]) -> tuple[list[dict], dict[str, list[dict]]]:
+    ids = {s["id"] for s in turno}
+    hijos: dict[str, list[dict]] = {}
+    raices = []
+    for s in sorted(turno, key=lambda s: s["inicio"]):
+        if s.get("padre") in ids:
+            hijos.setdefault(s["padre"], []).append(s)
+        else:
+            raices.append(s)
+    return raices, hijos
+
+
+def ruta_critica(turno: list[dict]) -> list[tuple[dict, float]]:
+    """
+    Spans que determinan la duración del turno y cuánto tiempo propio aporta cada uno a esa ruta.
+    Hacia atrás desde el final: el hijo que termina último es el que se estaba esperando; el hueco
+    entre hijos es tiempo propio del padre. Los hijos que sobreviven al padre (tareas lanzadas con
+    create_task, como procesar_langgraph desde el webhook) extienden la ruta del padre.
+    """
+    raices, hijos = _arbol(turno)
+    fin_efectivo: dict[str, float] = {}
+
+    def calcular_fin(s: dict) -> float:
+        if s["id"] not in fin_efectivo:
+            fin_efectivo[s["id"]] = max([_fin(s)] + [calcular_fin(h) for h in hijos.get(s["id"], [])])
+        return fin_efectivo[s["id"]]
+
+    def recorrer(s: dict, hasta: float) -> list[tuple[dict, float]]:
+        cursor = hasta
+        propio = 0.0
+        tramos = []
+        for h in sorted(hijos.get(s["id"], []), key=calcular_fin, reverse=True):
+            if h["inicio"] >= cursor:
+                continue
+            fin_h = min(calcular_fin(h), cursor)
+            propio += cursor - fin_h
+            tramos = recorrer(h, fin_h) + tramos
+            cursor = h["inicio"]
+        propio += max(cursor - s["inicio"], 0.0)
+        return [(s, propio)] + tramos
+
+    resultado = []
+    cursor = None
+    for raiz in sorted(raices, key=calcular_fin, reverse=True):
+        if cursor is not None and raiz["inicio"] >= cursor:
+            continue
+        fin_r = calcular_fin(raiz) if cursor is None else min(calcular_fin(raiz), cursor)
+        resultado = recorrer(raiz, fin_r) + resultado
+        cursor = raiz["inicio"]
+    return resultado
+
+
+def imprimir_turno(turno: list[dict], ancho: int = 50):
+    raices, hijos = _arbol(turno)
+    inicio = min(s["inicio"] for s in turno)
+    total = max(_fin(s) for s in turno) - inicio
+    escala = ancho / total if total > 0 else 0
+    conversacion = next((s["conversacion"] for s in turno if s.get("conversacion")), "?")
+    print(f"Turno {turno[0]['traza']} · conversación {conversacion} · {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(inicio))} · total {total * 1000:.0f} ms\n")
+
+    print(f"{'offset':>8} {'dur':>8}  {'':<{ancho}}  span")
+
+    def imprimir(s: dict, nivel: int):
+        desde = s["inicio"] - inicio
+        col = int(desde * escala)
+        largo = max(1, int(s["duracion_ms"] / 1000 * escala))
+        barra = (" " * col + ("!" if s.get("error") else "█") * largo)[:ancho]
+        extra = " ".join(f"{k}={v}" for k, v in (s.get("atributos") or {}).items())
+        error = f"  ERROR {s['error']}" if s.get("error") else ""
+        print(f"{desde * 1000:>6.0f}ms {s['duracion_ms']:>6.0f}ms  {barra:<{ancho}}  {'  ' * nivel}{s['nombre']} {extra}{error}")
+        for h in hijos.get(s["id"], []):
+            imprimir(h, nivel + 1)
+
+    for raiz in raices:
+        imprimir(raiz, 0)
+
+    print("\nRuta crítica (tiempo propio de cada span sobre la ruta):")
+    for s, propio in ruta_critica(turno):
+        if propio * 1000 >= 0.5:
+            porcentaje = propio / total * 100 if total > 0 else 0
+            print(f"  {propio * 1000:>8.0f} ms  {porcentaje:>5.1f}%  {s['nombre']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("conversacion", help="conversation_id de Chatwoot (o thread_id con namespace de tenant)")
+    parser.add_argument("--turno", type=int, default=-1, help="Índice del turno (default: el último)")
+    parser.add_argument("--listar", action="store_true", help="Listar los turnos de la conversación")
+    parser.add_argument("--archivo", default=TRAZAS_PATH)
+    args = parser.parse_args()
+
+    turnos = turnos_de(_leer_spans(args.archivo), args.conversacion)
+    if not turnos:
+        print(f"No hay trazas de la conversación {args.conversacion} en {args.archivo}")
+        sys.exit(1)
+
+    if args.listar:
+        for i, turno in enumerate(turnos):
+            inicio = min(s["inicio"] for s in turno)
+            total = max(_fin(s) for s in turno) - inicio
+            raiz = min(turno, key=lambda s: s["inicio"])["nombre"]
+            print(f"[{i:>3}] {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(inicio))}  {total * 1000:>8.0f} ms  {len(turno):>3} spans  {raiz}")
+        return
+
+    imprimir_turno(turnos[args.turno])
+
+
+if __name__ == "__main__":
+    main()
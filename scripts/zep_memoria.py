@@ -0,0 +1,226 @@
+import os
+import glob
+import json
+import time
+import asyncio
+
+from http_compartido import sesion_http
+import trazas
+from tenants import TENANT_DEFAULT, config_tenant, obtener_tenants, tenant_actual
+
+ZEP_URL_DEFAULT = os.getenv("ZEP_URL", "http://zep_server:8000")
+
+# Parámetros del write-behind
+ZEP_LOTE_MAX = int(os.getenv("ZEP_LOTE_MAX", "20"))                  # mensajes por sesión que disparan un flush inmediato
+ZEP_FLUSH_SEGUNDOS = float(os.getenv("ZEP_FLUSH_SEGUNDOS", "5"))     # edad máxima de un buffer antes de enviarse
+ZEP_REINTENTOS = int(os.getenv("ZEP_REINTENTOS", "3"))
+# Cada proceso escribe su propio archivo (zep_spill.<pid>.jsonl): con WORKERS > 0 no comparten uno
+ZEP_SPILL_PATH = os.getenv("ZEP_SPILL_PATH", "../.tmp/zep_spill.jsonl")
+ZEP_SPILL_MAX_BYTES = int(os.getenv("ZEP_SPILL_MAX_BYTES", str(5 * 1024 * 1024)))
+
+
+class EscritorZep:
+    """
+    Write-behind de la memoria de Zep: acumula los mensajes de cada sesión y los manda en lotes
+    (por tamaño o por tiempo) desde una tarea de fondo, fuera del camino de respuesta al lead.
+    Si Zep no responde tras los reintentos, el lote se guarda en un archivo de spill acotado y se reintenta luego.
+    """
+
+    def __init__(self):
+        # (tenant_id, session_id) -> {"mensajes": [...], "desde": monotonic del mensaje más viejo}
+        self.buffers: dict[tuple[str, str], dict] = {}
+        self._hay_lote_lleno = asyncio.Event()
+        self._envios_en_curso: set[tuple[str, str]] = set()
+        # Sesiones con un lote en el spill: sus mensajes nuevos esperan a que el spill vuelva, para no adelantarse
+        self._retenidas: set[tuple[str, str]] = set()
+        base, extension = os.path.splitext(ZEP_SPILL_PATH)
+        self._spill_propio = f"{base}.{os.getpid()}{extension}"
+        self._spill_patron = f"{glob.escape(base)}*{extension}"
+        self._spill_base, self._spill_extension = base, extension
+        self.inicio = time.monotonic()
+        self.metricas = {
+            "encolados": 0, "enviados": 0, "lotes_ok": 0, "lotes_fallidos": 0,
+            "reintentos": 0, "spill_guardados": 0, "spill_recuperados": 0, "descartados": 0,
+            "ultimo_lag_segundos": 0.0,
+        }
+
+    def encolar(self, session_id: str, mensajes: list[dict]):
+        """Agrega mensajes al buffer de la sesión (no bloquea: lo llama procesar_langgraph después de responder)."""
+        if not mensajes:
+            return
+        clave = (tenant_actual.get()["id"], session_id)
+        buffer = self.buffers.setdefault(clave, {"mensajes": [], "desde": time.monotonic()})
+        buffer["mensajes"].extend(mensajes)
+        self.metricas["encolados"] += len(mensajes)
+        if len(buffer["mensajes"]) >= ZEP_LOTE_MAX:
+            self._hay_lote_lleno.set()
+
+    async def correr(self):
+        """Tarea de fondo: flush por tamaño o por tiempo, y recuperación periódica del spill."""
+        await self._recuperar_spill()
+        ultima_recuperacion = time.monotonic()
+        while True:
+            try:
+                await asyncio.wait_for(self._hay_lote_lleno.wait(), timeout=ZEP_FLUSH_SEGUNDOS / 2)
+            except asyncio.TimeoutError:
+                pass
+            self._hay_lote_lleno.clear()
+            await self.flush()
+            if time.monotonic() - ultima_recuperacion > 60:
+                await self._recuperar_spill()
+                ultima_recuperacion = time.monotonic()
+
+    async def flush(self, todo: bool = False):
+        ahora = time.monotonic()
+        if todo:
+            # Al apagar, lo de una sesión retenida va detrás de su lote en el spill (enviarlo lo adelantaría)
+            for clave in [c for c in self.buffers if c in self._retenidas]:
+                self._guardar_spill(*clave, self.buffers.pop(clave)["mensajes"])
+        listas = [
+            clave for clave, b in self.buffers.items()
+            if clave not in self._envios_en_curso and clave not in self._retenidas
+            and (todo or len(b["mensajes"]) >= ZEP_LOTE_MAX or ahora - b["desde"] >= ZEP_FLUSH_SEGUNDOS)
+        ]
+        # Una sesión nunca tiene dos lotes en vuelo (el orden de los mensajes importa); sesiones distintas van en paralelo
+        await asyncio.gather(*(self._enviar_lote(clave) for clave in listas))
+
+    async def _enviar_lote(self, clave: tuple[str, str]):
+        # El buffer se saca recién acá: si la tarea se cancela antes de arrancar, sigue en self.buffers para el flush final
+        buffer = self.buffers.pop(clave, None)
+        if buffer is None:
+            return
+        tenant_id, session_id = clave
+        self._envios_en_curso.add(clave)
+        try:
+            for intento in range(ZEP_REINTENTOS):
+                try:
+                    await asyncio.to_thread(self._post, tenant_id, session_id, buffer["mensajes"])
+                    self.metricas["enviados"] += len(buffer["mensajes"])
+                    self.metricas["lotes_ok"] += 1
+                    self.metricas["ultimo_lag_segundos"] = round(time.monotonic() - buffer["desde"], 3)
+                    return
+                except Exception as e:
+                    if intento < ZEP_REINTENTOS - 1:
+                        self.metricas["reintentos"] += 1
+                        await asyncio.sleep(0.5 * 2 ** intento)
+                    else:
+                        print(f"Error mandando lote a Zep (sesión {session_id}, {len(buffer['mensajes'])} mensajes): {e}")
+            self.metricas["lotes_fallidos"] += 1
+            self._guardar_spill(tenant_id, session_id, buffer["mensajes"])
+        except asyncio.CancelledError:
+            # Apagado con el lote en vuelo: CancelledError no es Exception, así que sin esto el lote se perdía.
+            # Va al spill (si el POST llegó a completarse, Zep lo recibe dos veces: mejor que perderlo)
+            self._guardar_spill(tenant_id, session_id, buffer["mensajes"])
+            raise
+        finally:
+            self._envios_en_curso.discard(clave)
+
+    def _post(self, tenant_id: str, session_id: str, mensajes: list[dict]):
+        tenant = obtener_tenants().get(tenant_id, TENANT_DEFAULT)
+        zep_url = config_tenant("ZEP_URL", ZEP_URL_DEFAULT, tenant=tenant)
+        zep_api_key = config_tenant("ZEP_API_KEY", "", tenant=tenant)
+        headers = {}
+        if zep_api_key:
+            headers["Authorization"] = f"Api-Key {zep_api_key}"
+        # Corre fuera del turno (tarea de fondo): el span abre su propia traza, asociada a la conversación
+        with trazas.span("zep.escribir_lote", conversacion=session_id, mensajes=len(mensajes)):
+            resp = sesion_http.post(f"{zep_url}/api/v1/sessions/{session_id}/memory", json={"messages": mensajes}, headers=headers, timeout=3.0)
+            resp.raise_for_status()
+
+    def _guardar_spill(self, tenant_id: str, session_id: str, mensajes: list[dict]):
+        """Persiste un lote fallido. El archivo está acotado: si se llena, el lote se descarta y se cuenta."""
+        linea = json.dumps({"tenant": tenant_id, "session": session_id, "mensajes": mensajes}, ensure_ascii=False) + "\n"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self._spill_propio)), exist_ok=True)
+            tamano = os.path.getsize(self._spill_propio) if os.path.exists(self._spill_propio) else 0
+            if tamano + len(linea.encode("utf-8")) > ZEP_SPILL_MAX_BYTES:
+                self.metricas["descartados"] += len(mensajes)
+                print(f"⚠️ Spill de Zep lleno ({tamano} bytes). Se descartan {len(mensajes)} mensajes de la sesión {session_id}.")
+                return
+            with open(self._spill_propio, "a", encoding="utf-8") as f:
+                f.write(linea)
+            self.metricas["spill_guardados"] += len(mensajes)
+            self._retenidas.add((tenant_id, session_id))
+        except Exception as e:
+            self.metricas["descartados"] += len(mensajes)
+            print(f"Error guardando spill de Zep: {e}")
+
+    def _archivos_spill(self) -> list[str]:
+        """Spill de este proceso y de procesos anteriores (reinicios, workers que ya no existen), del más viejo al más nuevo."""
+        archivos = []
+        for ruta in glob.glob(self._spill_patron) + glob.glob(self._spill_patron + ".procesando.*"):
+            if ".procesando." in ruta:
+                dueno = ruta.rsplit(".", 1)[-1]
+            else:
+                dueno = ruta[len(self._spill_base) + 1:len(ruta) - len(self._spill_extension)]
+            # El spill de otro proceso vivo es suyo: él retiene esas sesiones y las libera al recuperarlo.
+            # Un .procesando de uno muerto quedó a medias y se retoma.
+            if dueno.isdigit() and int(dueno) != os.getpid() and _proceso_vivo(int(dueno)):
+                continue
+            archivos.append(ruta)
+        return sorted(archivos, key=lambda r: os.path.getmtime(r) if os.path.exists(r) else 0)
+
+    async def _recuperar_spill(self):
+        """
+        Vuelve a encolar los lotes del spill, delante de los mensajes nuevos de cada sesión. Cada archivo se
+        reclama renombrándolo a un nombre propio de este proceso: si otro worker lo reclamó antes, el rename falla.
+        """
+        lotes = []
+        for ruta in self._archivos_spill():
+            en_proceso = ruta if ruta.endswith(f".procesando.{os.getpid()}") else f"{ruta.split('.procesando.')[0]}.procesando.{os.getpid()}"
+            try:
+                if ruta != en_proceso:
+                    os.replace(ruta, en_proceso)
+                with open(en_proceso, encoding="utf-8") as f:
+                    leidas = f.readlines()
+                os.remove(en_proceso)
+                lotes.extend(leidas)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                print(f"Error leyendo spill de Zep: {e}")
+
+        recuperados: dict[tuple[str, str], list[dict]] = {}
+        for linea in lotes:
+            try:
+                lote = json.loads(linea)
+            except ValueError:
+                continue
+            recuperados.setdefault((lote["tenant"], lote["session"]), []).extend(lote["mensajes"])
+        for clave, mensajes in recuperados.items():
+            buffer = self.buffers.setdefault(clave, {"mensajes": [], "desde": time.monotonic()})
+            # Los mensajes recuperados son más viejos que los que hayan llegado mientras tanto
+            buffer["mensajes"][:0] = mensajes
+            self.metricas["spill_recuperados"] += len(mensajes)
+        # Solo se liberan las sesiones cuyo spill volvió al buffer: si un archivo no se pudo leer, las suyas siguen
+        # retenidas (el archivo queda como .procesando propio y se reintenta en la próxima recuperación)
+        self._retenidas -= recuperados.keys()
+        if lotes:
+            print(f"♻️ Zep: {len(lotes)} lotes recuperados del spill ({len(recuperados)} sesiones).")
+
+    def estado(self) -> dict:
+        ahora = time.monotonic()
+        pendientes = sum(len(b["mensajes"]) for b in self.buffers.values())
+        lag = max((ahora - b["desde"] for b in self.buffers.values()), default=0.0)
+        uptime = max(ahora - self.inicio, 1e-9)
+        return {
+            **self.metricas,
+            "pendientes": pendientes,
+            "sesiones_pendientes": len(self.buffers),
+            "sesiones_retenidas": len(self._retenidas),
+            "lag_segundos": round(lag, 3),
+            "throughput_msgs_por_segundo": round(self.metricas["enviados"] / uptime, 3),
+        }
+
+
+def _proceso_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+escritor_zep = EscritorZep()